@@ -0,0 +1,250 @@
+# Analysis helpers for SMU sweep data
+# Vectorized numpy routines shared by SMU.Format and SMU.Graph (no instrument needed)
+# Parameter extraction (Transfer, Output) returns one summary row per curve
+
+import numpy as np
+
+# Offsets where any of the columns changes value, e.g. every step of the outer sweep
+def Steps(*columns):
+    columns = [np.asarray(c) for c in columns]
+    rows = len(columns[0])
+    if rows == 0:
+        return np.zeros(1, dtype=np.intp)
+    change = np.zeros(rows - 1, dtype=bool)
+    for c in columns:
+        change |= c[1:] != c[:-1]                                           # True on the last row before a new value
+    return np.concatenate(([0], np.flatnonzero(change) + 1, [rows])).astype(np.intp) # Segment i is rows offsets[i]:offsets[i+1]
+
+# Rolling least squares slope dy/dx inside each segment, all segments in one pass
+def Slope(x, y, offsets, window=5):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lengths = np.diff(offsets)
+    segment = np.repeat(np.arange(len(lengths)), lengths)                   # Segment number of every row
+    start = offsets[:-1][segment]                                           # First row of each row's segment
+    end = offsets[1:][segment]                                              # One past last row of each row's segment
+
+    # Centered window, shifted inwards at the segment edges so it never crosses a step
+    i = np.arange(len(x))
+    lo = np.maximum(np.minimum(i - window//2, end - window), start)
+    hi = np.minimum(lo + window, end)
+    n = hi - lo
+
+    # Remove each segment's first point so the running sums stay well conditioned
+    x = x - x[start]
+    y = y - y[start]
+    def Window(v):                                                          # Sum of v over every row's window
+        c = np.concatenate(([0.0], np.cumsum(v)))
+        return c[hi] - c[lo]
+    sx, sy, sxx, sxy = Window(x), Window(y), Window(x*x), Window(x*y)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n*sxy - sx*sy) / (n*sxx - sx*sx)                           # Closed form least squares slope
+    slope[~np.isfinite(slope)] = np.nan                                     # Fewer than 2 points or x not swept
+    return slope
+
+# dy/dx (order=2 for d2y/dx2) for every curve, a curve being one combination of the key columns
+def Derivative(x, y, keys, window=5, order=1):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keys = [np.asarray(k) for k in keys]
+    if keys:
+        sort = np.lexsort(keys[::-1])                                       # Stable sort groups every curve, keeps sweep order
+        offsets = Steps(*[k[sort] for k in keys])                           # New curve when any key changes
+    else:
+        sort = np.arange(len(x))
+        offsets = np.array([0, len(x)], dtype=np.intp)
+
+    d = y[sort]
+    for _ in range(order):
+        d = Slope(x[sort], d, offsets, window)                              # Higher orders reuse the same engine
+    out = np.empty_like(d)
+    out[sort] = d                                                           # Back to original row order
+    return out
+
+# Midpoints to measure next on a curve (x sorted): intervals where a straight line between the readings is off by more than tol, worst first
+# Error of an interval ~ curvature*dx^2/8, curvature from the second differences at its ends, relative to the curve span (tol=0.01: 1% of the span)
+# Empty once every interval is within tol, so a smooth curve stops early instead of spending the whole point budget
+def Refine(x, y, tol=0.01, atol=1e-12, min_step=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) < 3:
+        return np.array([])                                                 # No curvature from two points
+    dx = np.diff(x)
+    slope = np.diff(y) / dx
+    curvature = np.abs(np.diff(slope)) / ((dx[:-1] + dx[1:]) / 2)           # |y''| at every inner point
+    bend = np.maximum(np.concatenate(([curvature[0]], curvature)), np.concatenate((curvature, [curvature[-1]]))) # Worst end of each interval
+    score = bend * dx**2 / 8 / (np.ptp(y) + atol)                           # Linear interpolation error of each interval, relative to the span
+    if min_step is None:
+        min_step = (x[-1] - x[0]) * 1e-3                                    # Stop splitting at 1/1000 of the sweep
+    flag = (score > tol) & (dx > 2*min_step)
+    worst = np.argsort(-score[flag], kind='stable')                         # Cap on points keeps the largest problems
+    return ((x[:-1] + x[1:]) / 2)[flag][worst]
+
+# Indexed view of a sweep table, built once: curve i is rows offsets[i]:offsets[i+1]
+class Curves:
+    def __init__(self, df, keys=1):
+        self.df = df
+        self.columns = list(df)
+        self.offsets = Steps(*[df[col].values for col in self.columns[:keys]]) # Curves split where the stepped column(s) change
+        self.keys = df.iloc[self.offsets[:-1]]                              # First row of every curve, holds its step values
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def Lines(self, x, y):
+        xy = np.column_stack((self.df[x].values, self.df[y].values))       # One copy of the two columns
+        return np.split(xy, self.offsets[1:-1])                             # Views of every curve, ready for a LineCollection
+
+##### Parameter extraction #####
+# Every function below works on all curves of a table at once: rows are sorted into curves, then reduced per curve
+
+# Rows sorted by keys then x, with the offsets of every curve
+def Sort(x, keys):
+    x = np.asarray(x, dtype=float)
+    keys = [np.asarray(k) for k in keys]
+    sort = np.lexsort([x] + keys[::-1])                                     # Curves together, x increasing inside each
+    offsets = Steps(*[k[sort] for k in keys]) if keys else np.array([0, len(x)], dtype=np.intp)
+    segment = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))      # Curve number of every sorted row
+    return sort, offsets, segment
+
+# Row of the largest value in every curve (first one on ties, NaN never wins)
+def Argmax(v, segment, offsets):
+    v = np.where(np.isnan(v), -np.inf, v)
+    return np.lexsort((-v, segment))[offsets[:-1]]                          # Stable sort: curve order kept, largest first in each
+
+# x where |y| first reaches level in every curve (x sorted), interpolated on log|y|; NaN if it never crosses inside the sweep
+def Crossing(x, a, level, segment, offsets):
+    above = a >= level
+    first = Argmax(above.astype(float), segment, offsets)
+    ok = above[first] & (first > offsets[:-1])
+    prev = np.maximum(first - 1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        la, lb = np.log10(a[prev]), np.log10(a[first])
+        return np.where(ok, x[prev] + (np.log10(level) - la) * (x[first] - x[prev]) / (lb - la), np.nan)
+
+# Transfer curves (Ids vs Vgs, one curve per combination of keys e.g. Vds): threshold, gm, swing and on/off
+# icc: current defining the constant current threshold, floor: currents below it are noise (ignored for the swing)
+def Transfer(df, vgs='Vgs (V)', ids='Ids (A)', keys=('Vds (V)',), window=5, icc=1e-7, floor=1e-11):
+    keys = list(keys)
+    sort, offsets, segment = Sort(df[vgs].values, [df[k].values for k in keys])
+    v = df[vgs].values.astype(float)[sort]
+    i = df[ids].values.astype(float)[sort]
+    start, last = offsets[:-1], offsets[1:] - 1
+
+    # Vth by linear extrapolation at max gm: tangent at the steepest point crosses Ids = 0
+    gm = Slope(v, i, offsets, window)
+    peak = Argmax(gm, segment, offsets)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vth_gm = v[peak] - i[peak] / gm[peak]                               # NaN for a flat curve (e.g. Vds = 0)
+
+    # Vth at constant current: first crossing of icc
+    a = np.abs(i)
+    vth_cc = Crossing(v, a, icc, segment, offsets)
+
+    # Subthreshold swing: steepest decade per volt below Vth, above the noise floor
+    with np.errstate(divide='ignore'):
+        decades = Slope(v, np.log10(np.maximum(a, floor)), offsets, 3)      # d log10(Ids) / dVgs
+    sub = (a > floor) & (v < vth_gm[segment])
+    steep = np.maximum.reduceat(np.where(sub & np.isfinite(decades), decades, -np.inf), start)
+    with np.errstate(divide='ignore'):
+        ss = np.where(steep > 0, 1e3 / steep, np.nan)                       # mV/dec
+
+    # On current at the highest Vgs, off current the smallest in the curve
+    ion = a[last]
+    ioff = np.minimum.reduceat(a, start)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = ion / ioff
+
+    out = df[keys].iloc[sort[start]].reset_index(drop=True)                 # Key values of every curve
+    out['Vth_gm (V)'] = vth_gm
+    out['Vth_cc (V)'] = vth_cc
+    out['gm_max (S)'] = gm[peak]
+    out['Vgs at gm_max (V)'] = v[peak]
+    out['SS (mV/dec)'] = ss
+    out['Ion (A)'] = ion
+    out['Ioff (A)'] = ioff
+    out['Ion/Ioff'] = ratio
+    vds = next((k for k in keys if k.startswith('Vds')), None)
+    if vds is not None:
+        out['DIBL (mV/V)'] = Dibl(out, vds, [k for k in keys if k != vds])
+    return out
+
+# Drain induced barrier lowering per device: Vth shift between its lowest and highest Vds curve with a Vth, in mV/V
+def Dibl(summary, vds='Vds (V)', device=(), vth='Vth_cc (V)'):
+    device = list(device)
+    d = summary[vds].values.astype(float)
+    t = summary[vth].values.astype(float)
+    if np.isnan(t).all():
+        t = summary['Vth_gm (V)'].values.astype(float)                     # No icc crossing anywhere: use the extrapolated Vth
+    sort, offsets, segment = Sort(d, [summary[k].values for k in device])
+    valid = np.isfinite(t[sort])                                            # Curves without a Vth (e.g. Vds = 0) are left out
+    lo = sort[Argmax(np.where(valid, -d[sort], np.nan), segment, offsets)]  # Lowest and highest Vds of every device
+    hi = sort[Argmax(np.where(valid, d[sort], np.nan), segment, offsets)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dibl = -(t[hi] - t[lo]) / (d[hi] - d[lo]) * 1e3
+    out = np.empty(len(d))
+    out[sort] = dibl[segment]                                               # Same value on every curve of the device
+    return out
+
+# Output curves (Ids vs Vds, one curve per combination of keys e.g. Vgs): on resistance and output conductance
+def Output(df, vds='Vds (V)', ids='Ids (A)', keys=('Vgs (V)',), window=5):
+    keys = list(keys)
+    sort, offsets, segment = Sort(df[vds].values, [df[k].values for k in keys])
+    v = df[vds].values.astype(float)[sort]
+    i = df[ids].values.astype(float)[sort]
+    g = Slope(v, i, offsets, window)                                        # Windows shift inwards at the ends of every curve
+    start, last = offsets[:-1], offsets[1:] - 1
+    out = df[keys].iloc[sort[start]].reset_index(drop=True)
+    with np.errstate(divide='ignore'):
+        out['Ron (Ohm)'] = 1 / g[start]                                     # Linear region, lowest Vds
+    out['gds (S)'] = g[last]                                                # Saturation, highest Vds
+    out['Ids at max Vds (A)'] = i[last]
+    return out
+
+# Hysteresis of up/down sweeps (tagged in the direction column), one row per curve
+# Up and down readings are paired by x; an x missing on one side (e.g. an over range reading removed as NaN) is skipped and counted
+# Max dI: largest |I_down - I_up| at the same x, Loop area: integral of |I_down - I_up| dx, dV at icc: shift of the icc crossing (down - up)
+def Hysteresis(df, x='Vgs (V)', y='Ids (A)', keys=('Vds (V)',), direction='Direction', icc=1e-7):
+    keys = list(keys)
+    down = df[direction].values == 'down'
+    x_all = df[x].values.astype(float)
+    y_all = df[y].values.astype(float)
+    sort, offsets, segment = Sort(x_all, [df[k].values for k in keys])
+    curves = len(offsets) - 1
+    curve = np.empty(len(x_all), dtype=np.intp)
+    curve[sort] = segment                                                   # Curve number of every row
+
+    # Up and down of every (curve, x) side by side, NaN where a side is missing
+    v, c, d, i = x_all[sort], segment, down[sort], y_all[sort]
+    points = Steps(c, v)
+    first = points[:-1]
+    up_i = np.fmax.reduceat(np.where(d, np.nan, i), first)                  # fmax skips the NaN of the other direction
+    down_i = np.fmax.reduceat(np.where(d, i, np.nan), first)
+    px, pc = v[first], c[first]
+    di = np.abs(down_i - up_i)
+    paired = np.isfinite(di)
+    px, pc, di = px[paired], pc[paired], di[paired]
+
+    same = pc[1:] == pc[:-1]                                                # Trapezoids between paired points of a curve
+    area = np.bincount(pc[1:][same], weights=((di[1:] + di[:-1]) / 2 * np.diff(px))[same], minlength=curves)
+    max_di = np.full(curves, np.nan)
+    np.fmax.at(max_di, pc, di)
+
+    # icc crossing of every curve and direction
+    order = np.lexsort((x_all, down, curve))
+    doffsets = Steps(curve[order], down[order])
+    dsegment = np.repeat(np.arange(len(doffsets) - 1), np.diff(doffsets))
+    cross = Crossing(x_all[order], np.abs(y_all[order]), icc, dsegment, doffsets)
+    owner, is_down = curve[order][doffsets[:-1]], down[order][doffsets[:-1]]
+    up_cross, down_cross = np.full(curves, np.nan), np.full(curves, np.nan)
+    up_cross[owner[~is_down]] = cross[~is_down]
+    down_cross[owner[is_down]] = cross[is_down]
+
+    out = df[keys].iloc[sort[offsets[:-1]]].reset_index(drop=True)          # Key values of every curve
+    out['Max dI (A)'] = max_di
+    out['Loop area (A*V)'] = area
+    out['dV at icc (V)'] = down_cross - up_cross
+    out['Unpaired points'] = np.bincount(c[first][~paired], minlength=curves) # x read in one direction only, left out above
+    return out
+
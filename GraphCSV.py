@@ -0,0 +1,316 @@
+# by John Barney
+# For: plotting csv files (specifically from Cadence Virtuoso) to matplotlib png
+
+import matplotlib.pyplot as plt                                                                                             # importing plotting module
+import pandas as pd                                                                                                         # importing dataframe module
+import numpy as np                                                                                                          # importing array module
+import os                                                                                                                   # file sizes and times for the cache
+import json                                                                                                                 # column names of cached files
+import hashlib                                                                                                              # cache file names
+import glob                                                                                                                 # csv files of a batch
+import argparse                                                                                                             # command line batch mode
+import time                                                                                                                 # batch timing
+
+savefile = "~/Downloads/"                                                                                                   # where to save file (downloads initialization)
+cachedir = os.path.join(os.path.expanduser('~'),'.cache','GraphCSV')                                                        # parsed csv files kept as .npy to memory map next time (None: no cache)
+cachesize = 2*1024**3                                                                                                       # bytes the cache may use, least recently used files are removed past it
+
+def Help():                                                                                                                 # defining help function
+    print("\n\n\
+    **********Examples**********\n\
+    import GraphCSV as G                                                                                                                                    # importing file\n\
+    G.savefile = 'C:/Users/johnb/Desktop/'                                                                                                                  # declaring save location\n\
+    G.Graph('C:/Users/johnb/waveform.csv','Time (s)', 'Volts (V)', title='Seperate Plots'   ,legendloc='upper right').Seperate()                            # seperate plots example\n\
+    G.Graph('C:/Users/johnb/waveform.csv','Time (s)', 'Volts (V)', title='Overlayed Plots'  ,linetype='--').Overlay(multi_x=False)                          # overlayed plots example\n\
+    G.Graph('C:/Users/johnb/waveform.csv','Time (s)', 'Volts (V)', title='Stacked Plots'    ,figsize=(10,10)).Stack(multi_x=True,sharex=True,sharey=False)  # stacked plots example\n\
+    G.Graph('C:/Users/johnb/waveform.csv','Time (s)', 'Volts (V)', title='Fitted Plots'     ).Overlay_FitCurve(degree_fit=2,start=0,end=1e-6,pieces=4)      # windowed piecewise fit, returns table\n\
+    G.Graph('C:/Users/johnb/transient.csv','Time (s)', 'Volts (V)', title='Big Export'      ,dtype='float32',chunksize=10**6).Overlay(multi_x=True)         # large export, float32 read in chunks\n\
+    \n\
+    **********Notes**********\n\
+    Use '/' or '\\\\' for '\\' in file paths\n\
+    (Due to '\\' being a special character to python)\n\n\
+    Columns may have different lengths (each x/y pair is trimmed to its own data)\n\
+        multi_x=True: columns are x, y, x, y, ... every signal with its own x\n\
+        multi_x=False: column 0 is the x of every y (columns 1, 3, 5, ...)\n\
+    columns=[...] only reads those columns, dtype='float32' halves memory,\n\
+    chunksize=n reads huge files n rows at a time\n\
+    Parsed files are cached in G.cachedir (G.cachesize bytes), cache=False skips it\n\
+    \n\
+    **********Batch (command line)**********\n\
+    python GraphCSV.py C:/Users/johnb/sims/ --plot Stack --multi-x --xlabel 'Time (s)' --ylabel 'Volts (V)' --out C:/Users/johnb/figures/\n\
+        every csv of a directory or glob rendered in parallel to <name>_<plot>.png, plots newer than their csv are skipped (--force redoes them)\n\
+    ")
+
+def Engine():                                                                                                               # csv parser to use: multithreaded pyarrow if installed, else pandas' c parser
+    try:
+        import pyarrow                                                                                                      # optional, only speeds up reading
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
+
+def Numeric(df,dtype=np.float64):                                                                                           # every column to numbers, text (units, 'NaN' strings, ...) becomes NaN
+    return df.apply(pd.to_numeric,errors='coerce').astype(dtype)                                                            # one conversion per column, no copies of the whole frame in between
+
+def Load(file,columns=None,dtype=np.float64,chunksize=None,cache=True):                                                     # csv as numeric dataframe, memory mapped from the cache if parsed before
+    cache = cache and cachedir is not None
+    if cache:
+        path = Cached(file,columns,dtype)                                                                                   # same file, size, mtime and options -> same entry
+        try:
+            with open(path[:-4]+'.json') as f:
+                names = json.load(f)
+            df = pd.DataFrame(np.load(path,mmap_mode='r'),columns=names,copy=False)                                         # no parsing, pages are read as they are plotted
+            os.utime(path)                                                                                                  # recently used, evicted last
+            return df
+        except (OSError,ValueError):                                                                                        # not cached yet (or evicted meanwhile)
+            pass
+    df = Parse(file,columns,dtype,chunksize)
+    if cache:
+        Store(df,path)
+    return df
+
+def Cached(file,columns=None,dtype=np.float64):                                                                             # cache path of one version of a csv read one way
+    stat = os.stat(file)
+    key = repr((os.path.abspath(file),stat.st_size,stat.st_mtime_ns,columns,np.dtype(dtype).str))
+    return os.path.join(cachedir,hashlib.sha1(key.encode()).hexdigest()+'.npy')
+
+def Store(df,path):                                                                                                         # writing a parsed csv to the cache, then trimming the cache
+    os.makedirs(cachedir,exist_ok=True)
+    with open(path+'.tmp','wb') as f:
+        np.save(f,df.to_numpy())                                                                                            # one typed block, memory mappable
+    with open(path[:-4]+'.json','w') as f:
+        json.dump(list(df.columns),f)
+    os.replace(path+'.tmp',path)                                                                                            # whole file or nothing, other processes may be reading
+    Evict()
+
+def Evict():                                                                                                                # removing least recently used entries until the cache fits in cachesize
+    files = sorted((os.path.join(cachedir,name) for name in os.listdir(cachedir) if name.endswith('.npy')),key=os.path.getmtime,reverse=True)
+    total = 0
+    for path in files:
+        total += os.path.getsize(path)
+        if total > cachesize:
+            try:
+                os.remove(path)
+                os.remove(path[:-4]+'.json')
+            except OSError:                                                                                                 # still open elsewhere (windows) or already gone
+                pass
+
+def Parse(file,columns=None,dtype=np.float64,chunksize=None):                                                               # reading a csv straight into typed numeric columns
+    if chunksize is None:
+        try:
+            df = pd.read_csv(file,usecols=columns,dtype=dtype,engine=Engine())                                              # one typed pass over the file
+        except (ValueError,TypeError):                                                                                      # text somewhere in a numeric column
+            df = Numeric(pd.read_csv(file,usecols=columns,engine=Engine()),dtype)
+    else:                                                                                                                   # huge files: only one chunk of text in memory at a time
+        df = pd.concat([Numeric(chunk,dtype) for chunk in pd.read_csv(file,usecols=columns,chunksize=chunksize)],ignore_index=True)
+    return df.loc[:,df.notna().any().values]                                                                                # removing all only NaN value columns in one step
+
+def Fit(series,degree=1,start=None,end=None,pieces=1):                                                                      # polynomial least squares fit of every (x, y, label) series, as a table
+    groups = {}                                                                                                             # series sharing x values and gaps share one Vandermonde matrix
+    for n,(x,y,label) in enumerate(series):
+        x = np.ascontiguousarray(x,dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        key = np.where(valid,x,0.0) + 0.0                                                                                   # same bytes for equal x: -0.0 as 0.0, unused values zeroed
+        groups.setdefault((key.tobytes(),np.packbits(valid).tobytes()),[]).append(n)
+    powers = [f"x^{k}" for k in range(degree,-1,-1)]                                                                        # highest power first, like np.polyfit
+    rows = []                                                                                                               # one block of the table per group and piece
+    for members in groups.values():
+        x, y, label = series[members[0]]
+        x = np.asarray(x,dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        xv = x[valid]
+        Y = np.column_stack([series[n][1][valid] for n in members])                                                         # every y of the group as one right hand side
+        lo = (np.min(xv) if len(xv) else np.nan) if start is None else start                                                # window, whole signal if not given
+        hi = (np.max(xv) if len(xv) else np.nan) if end is None else end
+        edges = np.linspace(lo,hi,pieces+1)                                                                                 # equal width pieces of the window
+        for piece in range(pieces):
+            inside = (xv >= edges[piece]) & ((xv < edges[piece+1]) if piece < pieces-1 else (xv <= edges[piece+1]))          # [start, end), the last piece also takes end: a point is in one piece only
+            V = np.vander(xv[inside],degree+1)                                                                              # built once for every column of the group
+            if len(V) > degree:
+                scale = np.sqrt((V*V).sum(axis=0))                                                                          # column scaling for conditioning (as np.polyfit)
+                scale[scale == 0] = 1
+                coefficients = np.linalg.lstsq(V/scale,Y[inside],rcond=None)[0]/scale[:,None]                               # one solve for all columns
+                residual = Y[inside] - V@coefficients
+                sse = (residual**2).sum(axis=0)
+                sst = ((Y[inside]-Y[inside].mean(axis=0))**2).sum(axis=0)
+                with np.errstate(divide='ignore',invalid='ignore'):
+                    r2 = 1 - sse/sst
+            else:                                                                                                           # too few points in the piece
+                coefficients = np.full((degree+1,len(members)),np.nan)
+                sse = r2 = np.full(len(members),np.nan)
+            rows.append(pd.DataFrame({'order': members, 'Series': [series[n][2] for n in members], 'Piece': piece, 'Start': edges[piece],
+                                      'End': edges[piece+1], 'Points': int(inside.sum()), **dict(zip(powers,coefficients)), 'SSE': sse, 'R2': r2}))
+    columns = ['Series','Piece','Start','End','Points']+powers+['SSE','R2']
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(rows).sort_values(['order','Piece'])[columns].reset_index(drop=True)                                   # in the order of the series
+
+class Graph():                                                                                                              # initializing class for graphing
+    def __init__(self,file,xlabel='',ylabel='',title='',figsize=(8,5),legendloc='upper right',linetype='-',xscale='linear',yscale='linear',columns=None,dtype=np.float64,chunksize=None,cache=True):    # initialization function
+        self.file = file                                                                                                    # input sheet to grap
+        self.df = Load(self.file,columns,dtype,chunksize,cache)                                                             # open csv as numeric dataframe, only NaN columns removed
+        self.columns = list(self.df)                                                                                        # get column names
+        self.xlabel = xlabel                                                                                                # initialize x axis label
+        self.ylabel = ylabel                                                                                                # initialize y axis label
+        self.title = title                                                                                                  # initialize title label
+        self.legendloc = legendloc                                                                                          # initialize location of legend
+        self.linetype = linetype                                                                                            # initialize type of line to plot
+        self.figsize = figsize                                                                                              # initialize figure size variable
+        self.xscale = xscale
+        self.yscale = yscale
+
+    def Series(self,multi_x=False):                                                                                         # every x/y pair as its own trimmed arrays: [(x, y, label), ...]
+        data = self.df.to_numpy()                                                                                           # one block, columns are views into it
+        lengths = len(data) - np.argmax(~np.isnan(data[::-1]),axis=0)                                                       # rows up to the last value of every column (trailing NaN of shorter signals cut)
+        if multi_x:
+            pairs = [(col,col+1) for col in range(0,len(self.columns)-1,2)]                                                 # x, y, x, y, ... each signal with its own x column
+        else:
+            pairs = [(0,col) for col in range(1,len(self.columns),2)]                                                       # first x shared by every y (other x columns skipped)
+        series = []
+        for xcol,ycol in pairs:
+            n = min(lengths[xcol],lengths[ycol])                                                                            # own length of every pair, no padding
+            series.append((data[:n,xcol],data[:n,ycol],str(self.columns[ycol])))                                            # slices, no copies
+        return series
+
+    def Draw(self,ax,x,y,label,linetype=None):                                                                              # plotting one series with the x and y scales of the graph
+        linetype = self.linetype if linetype is None else linetype
+        if (self.xscale == 'log' and self.yscale == 'log'):                                                                 # checking if both x and y are log
+            return ax.loglog(x,y,linetype,label=label)
+        elif (self.xscale == 'log'):                                                                                        # checking if just x is log
+            return ax.semilogx(x,y,linetype,label=label)
+        elif (self.yscale == 'log'):                                                                                        # checking if just y is log
+            return ax.semilogy(x,y,linetype,label=label)
+        return ax.plot(x,y,linetype,label=label)                                                                            # in all other cases
+
+    def Seperate(self,multi_x=False):                                                                                       # function to graph csv columns independently
+        fig, ax = plt.subplots(figsize=self.figsize)                                                                        # one figure for every signal, only the line changes
+        try:
+            line = None
+            for n,(x,y,label) in enumerate(self.Series(multi_x)):                                                           # iterate through signals
+                if line is None:
+                    line, = self.Draw(ax,x,y,label)                                                                         # first signal sets up scales, labels and legend
+                    legend = ax.legend(loc=self.legendloc)                                                                  # displaying legend on graph
+                    ax.set_xlabel(self.xlabel)                                                                              # labeling x axis
+                    ax.set_ylabel(self.ylabel)                                                                              # labeling y axis
+                else:
+                    line.set_data(x,y)                                                                                      # next signal in the same line artist
+                    line.set_label(label)
+                    legend.get_texts()[0].set_text(label)
+                    ax.relim()                                                                                              # limits of the new data
+                    ax.autoscale_view()
+                ax.set_title(self.title+'_'+str(n+1))                                                                       # labeling title + number
+                fig.savefig(savefile+self.title+'_'+str(n+1)+'.png')                                                        # saving plot to save location as png
+        finally:
+            plt.close(fig)                                                                                                  # closing figure so memory doesn't keep growing, even on errors
+
+    def Overlay(self,multi_x=False):                                                                                        # function to overlay graphs by x axis
+        fig, ax = plt.subplots(figsize=self.figsize)                                                                        # setting up subplots for overlay graphing
+        for x,y,label in self.Series(multi_x):                                                                              # iterate through signals
+            self.Draw(ax,x,y,label)                                                                                         # plot signals in same graph
+        ax.legend(loc=self.legendloc)                                                                                       # displaying legend on graph
+        ax.set_xlabel(self.xlabel)                                                                                          # labeling x axis
+        ax.set_ylabel(self.ylabel)                                                                                          # labeling y axis
+        fig.suptitle(self.title)                                                                                            # labeling title
+        fig.savefig(savefile+self.title+'.png')                                                                             # saving plot to save location as png
+        plt.close(fig)                                                                                                      # closing figure so memory doesn't keep growing
+
+    def Stack(self, multi_x=False,sharex=False,sharey=False):                                                               # function to stack graphs, one per signal
+        series = self.Series(multi_x)
+        fig, ax = plt.subplots(len(series), sharex=sharex, sharey=sharey, figsize=self.figsize, squeeze=False)              # setting up subplots for stacked graphing
+        for n,(x,y,label) in enumerate(series):                                                                             # iterate through signals
+            self.Draw(ax[n,0],x,y,label)                                                                                    # plot signal in its own graph
+            ax[n,0].legend(bbox_to_anchor=(1.3,1))                                                                          # displaying legend on graph
+        fig.text(0.5, 0.04, self.xlabel, ha='center')                                                                       # labeling x axis
+        fig.text(0.04, 0.5, self.ylabel, va='center', rotation='vertical')                                                  # labeling y axis
+        fig.suptitle(self.title)                                                                                            # labeling title
+        fig.subplots_adjust(right=.75)                                                                                      # adding padding to right side of image for labels
+        fig.savefig(savefile+self.title+'.png')                                                                             # saving plot to save location as png
+        plt.close(fig)                                                                                                      # closing figure so memory doesn't keep growing
+
+    def Overlay_FitCurve(self,start='',end='',number_points=10,degree_fit=1,linetype='--',multi_x=False,pieces=1,xticks=0): # plotting every signal with its fitted polynomial, returns the fit table
+        start = None if start=='' else start                                                                                # '' fits the whole x range of every signal
+        end = None if end=='' else end
+        series = self.Series(multi_x)
+        self.fits = Fit(series,degree_fit,start,end,pieces)                                                                 # one least squares call per shared x
+        powers = [f"x^{k}" for k in range(degree_fit,-1,-1)]
+        fig, ax = plt.subplots(figsize=self.figsize)                                                                        # setting up subplots for overlay graphing
+        for x,y,label in series:                                                                                            # iterate through signals, each with its own x when multi_x
+            self.Draw(ax,x,y,label)                                                                                         # plotting x and y points
+        coefficients = self.fits[powers].to_numpy()                                                                         # highest power first, as np.polyval takes them
+        for row,coefficient in zip(self.fits.itertuples(),coefficients):                                                    # every fitted signal (and piece)
+            xp = np.linspace(row.Start,row.End,number_points)                                                               # fit drawn over the window it was fitted on
+            name = f"{row.Series}_fit" + (f"_{row.Piece+1}" if pieces>1 else '')
+            self.Draw(ax,xp,np.polyval(coefficient,xp),name,linetype)                                                       # plotting fitted curve
+        if xticks!=0:                                                                                                       # checking to see if x axis ticks marks have changed
+            lo, hi = ax.get_xlim()
+            ax.set_xticks(np.arange(lo,hi,xticks))                                                                          # setting x axis tick marks to new spacing
+        ax.legend(loc=self.legendloc)                                                                                       # displaying legend on graph
+        ax.set_xlabel(self.xlabel)                                                                                          # labeling x axis
+        ax.set_ylabel(self.ylabel)                                                                                          # labeling y axis
+        fig.suptitle(self.title)                                                                                            # labeling title
+        fig.savefig(savefile+self.title+'.png')                                                                             # saving plot to save location as png
+        plt.close(fig)                                                                                                      # closing figure so memory doesn't keep growing
+        return self.fits
+
+def Files(inputs):                                                                                                          # csv files of directories, globs and paths, in order, once each
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += sorted(glob.glob(os.path.join(item,'*.csv')))                                                          # every csv of the directory
+        else:
+            files += sorted(glob.glob(item)) or [item]                                                                      # glob, or a path (missing files fail in the report)
+    return list(dict.fromkeys(files))
+
+def Output(out,title,plot):                                                                                                 # png a plot method writes (first one for Seperate)
+    return out+title+('_1' if plot == 'Seperate' else '')+'.png'
+
+def main(argv=None):                                                                                                        # rendering a batch of csv files headless, one process per core
+    import Render                                                                                                           # process pool on the Agg backend
+    parser = argparse.ArgumentParser(description='Plot csv files (Cadence Virtuoso exports) to png in parallel')
+    parser.add_argument('inputs',nargs='+',help='csv files, directories or globs')
+    parser.add_argument('--plot',default='Overlay',choices=['Seperate','Overlay','Stack','Overlay_FitCurve'])
+    parser.add_argument('--xlabel',default='')
+    parser.add_argument('--ylabel',default='')
+    parser.add_argument('--title',default='{name}_{plot}',help="title and png name, {name} is the csv name and {plot} the plot type")
+    parser.add_argument('--xscale',default='linear',choices=['linear','log'])
+    parser.add_argument('--yscale',default='linear',choices=['linear','log'])
+    parser.add_argument('--linetype',default='-')
+    parser.add_argument('--legendloc',default='upper right')
+    parser.add_argument('--figsize',nargs=2,type=float,default=(8,5))
+    parser.add_argument('--dtype',default='float64')
+    parser.add_argument('--multi-x',action='store_true',help='columns are x, y, x, y, ...')
+    parser.add_argument('--sharex',action='store_true',help='Stack only')
+    parser.add_argument('--sharey',action='store_true',help='Stack only')
+    parser.add_argument('--degree',type=int,default=1,help='Overlay_FitCurve only')
+    parser.add_argument('--out',default=None,help='where to save the png files (default: next to every csv)')
+    parser.add_argument('--processes',type=int,default=None,help='worker processes (default: one per core)')
+    parser.add_argument('--force',action='store_true',help='render even if the png is newer than its csv')
+    args = parser.parse_args(argv)
+
+    plot_kwargs = {'multi_x': args.multi_x}
+    if args.plot == 'Stack':
+        plot_kwargs.update(sharex=args.sharex,sharey=args.sharey)
+    if args.plot == 'Overlay_FitCurve':
+        plot_kwargs.update(degree_fit=args.degree)
+
+    jobs, skipped = [], 0
+    for file in Files(args.inputs):
+        name = os.path.splitext(os.path.basename(file))[0]
+        title = args.title.format(name=name,plot=args.plot)                                                                 # plot type in the png name: another --plot is never taken as up to date
+        out = os.path.join(args.out if args.out is not None else os.path.dirname(os.path.abspath(file)),'')                 # trailing separator, savefile is a prefix
+        png = Output(out,title,args.plot)
+        if not args.force and os.path.exists(file) and os.path.exists(png) and os.path.getmtime(png) >= os.path.getmtime(file):
+            skipped += 1                                                                                                    # up to date
+            continue
+        kwargs = dict(title=title,figsize=tuple(args.figsize),legendloc=args.legendloc,linetype=args.linetype,xscale=args.xscale,yscale=args.yscale,dtype=args.dtype)
+        jobs.append(Render.Job('GraphCSV',(file,args.xlabel,args.ylabel),args.plot,kwargs,plot_kwargs,savefile=out))
+    if args.out is not None:
+        os.makedirs(args.out,exist_ok=True)
+
+    start = time.perf_counter()
+    results = Render.Render(jobs,args.processes) if jobs else []                                                            # per file time and failure printed as they are collected
+    failed = sum(error is not None for job,seconds,error in results)
+    print(f"{len(results)-failed} rendered, {failed} failed, {skipped} up to date ({time.perf_counter()-start:0.2f} s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
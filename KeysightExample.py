@@ -5,14 +5,18 @@
 # *********************************************************
 # Import modules.
 # ---------------------------------------------------------
-import pyvisa
 import string
 import struct
 import sys
+from Oscilloscope import LazyResource  # VISA handle opened on first use, shared with Oscilloscope.py
 # Global variables (booleans: 0 = False, 1 = True).
 # ---------------------------------------------------------
 debug = 0
 # =========================================================
+# Oscilloscope handle, opened on first use:
+# =========================================================
+Infiniium = LazyResource("TCPIP0::169.254.205.81::hislip0::INSTR", 20000)
+# =========================================================
 # Initialize:
 # =========================================================
 def initialize():
@@ -322,15 +326,14 @@ def check_instrument_errors(command, exit_on_error=True):
 # =========================================================
 # Main program:
 # =========================================================
-rm = pyvisa.ResourceManager()
-Infiniium = rm.open_resource("TCPIP0::169.254.205.81::hislip0::INSTR")
-Infiniium.timeout = 20000
-Infiniium.clear()
-
-# Initialize the oscilloscope, capture data, and analyze.
-initialize()
-capture()
-analyze()
-Infiniium.close()
-print("End of program.")
-sys.exit()
+def main():
+    # Initialize the oscilloscope, capture data, and analyze.
+    initialize()
+    capture()
+    analyze()
+    Infiniium.close()
+    print("End of program.")
+
+if __name__ == "__main__":
+    main()
+    sys.exit()
@@ -4,7 +4,6 @@
 # =============================================
 # Module Imports
 # =============================================
-import pyvisa as visa
 import string
 import struct
 import sys
@@ -23,6 +22,45 @@ KEYSIGHT_UTCADDRESS = "TCPIP0::10.44.11.1::INSTR"
 GLOBAL_TOUT = 10000
 
 
+# =============================================
+# Lazy Oscilloscope Handle
+# =============================================
+
+# Opens the VISA resource on first use, so importing this file needs no oscilloscope (or pyvisa); also used by KeysightExample.py
+class LazyResource:
+	def __init__(self, address, timeout):
+		self.address = address
+		self.timeout_ms = timeout
+		self.resource = None
+
+	def open(self):
+		if self.resource is None:
+			import pyvisa as visa
+			# VISA Manager Install Directory (defaults to C:\\Windows\\System32\\visa32.dll)
+			rm = visa.ResourceManager()
+			# Setup which connection type desired
+			self.resource = rm.open_resource(self.address)
+			# Select a timeout time
+			self.resource.timeout = self.timeout_ms
+			# Clears instrument bus
+			self.resource.clear()
+		return self.resource
+
+	def close(self):
+		if self.resource is not None:
+			self.resource.close()
+			self.resource = None
+
+	def __getattr__(self, name):
+		if name.startswith("__"):
+			raise AttributeError(name)
+		return getattr(self.open(), name)
+
+
+# Oscilloscope, connected on first command
+OS = LazyResource(KEYSIGHT_ADDRESS, GLOBAL_TOUT)
+
+
 # =============================================
 # Initialize Oscilloscope Connection
 # =============================================
@@ -316,41 +354,34 @@ def analyze():
 # =============================================
 # Main loop
 # =============================================
-# VISA Manager Install Directory (defaults to C:\\Windows\\System32\\visa32.dll)
-rm = visa.ResourceManager()
-
-# Setup which connection type desired
-OS = rm.open_resource(KEYSIGHT_ADDRESS)
-
-# Select a timeout time
-OS.timeout = GLOBAL_TOUT
-
-# Clears instrument bus
-OS.clear()
-
-# check_instrument_errors()
-initialize()
+def main():
+	# Connects to the oscilloscope on the first command
+	# check_instrument_errors()
+	initialize()
 
-os_parameters()
+	os_parameters()
 
-# Trigger Count Test Code
-i = 0
-infCT = rx_num(":COUNter3:CURRent?")
+	# Trigger Count Test Code
+	i = 0
+	infCT = rx_num(":COUNter3:CURRent?")
 
-capture()
-analyze()
+	capture()
+	analyze()
 
-# while i < 7 or infCT > 9.9*10**36:
-#     CHAN1_trigcount = rx_num(":COUNter3:CURRent?")  # Query ASCII assigns value in a singular value list
-#     i = CHAN1_trigcount  # Updating increment value
-#     if i == infCT:
-#         print(0)
-#         time.sleep(0.1)
-#     else:
-#         infCT = 0
-#         print(i)
-#         time.sleep(0.1)
+	# while i < 7 or infCT > 9.9*10**36:
+	#     CHAN1_trigcount = rx_num(":COUNter3:CURRent?")  # Query ASCII assigns value in a singular value list
+	#     i = CHAN1_trigcount  # Updating increment value
+	#     if i == infCT:
+	#         print(0)
+	#         time.sleep(0.1)
+	#     else:
+	#         infCT = 0
+	#         print(i)
+	#         time.sleep(0.1)
 
+	OS.close()
+	print("End of program.")
 
-print("End of program.")
 
+if __name__ == "__main__":
+	main()
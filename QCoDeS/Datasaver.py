@@ -0,0 +1,47 @@
+# --------------------------------------------------------
+# Saving large array results (oscilloscope traces) to experiments.db
+#  --------------------------------------------------------
+
+# =============================================
+# README
+# =============================================
+
+# What this does
+# ------------------------
+# register_traces(): traces are stored as one binary array per result (paramtype 'array')
+#                    instead of one database row per point (paramtype 'numeric')
+# fast_run():        meas.run() where add_result only buffers, rows are written in one transaction
+#                    every write_period seconds by a background thread, and the dataset is not
+#                    also kept in memory (that copy grows with every trace and dominates large runs)
+
+# Example
+# ------------------------
+# from Datasaver import register_traces, fast_run
+# register_traces(meas, [ch3], setpoints=[nPoints])
+# with fast_run(meas) as datasaver:
+#     datasaver.add_result((nPoints, n), (ch3, ch3.get()))
+
+
+# =============================================
+# Imports
+# =============================================
+
+import inspect
+
+
+# =============================================
+# Functions
+# =============================================
+
+# Registers array valued parameters to be stored as compact binary blobs, one per add_result
+def register_traces(meas, traces, setpoints=None):
+    for trace in traces:
+        meas.register_parameter(trace, setpoints=setpoints, paramtype='array')
+
+
+# meas.run() for many large results: batched writes on a background thread, no in-memory copy of the dataset
+def fast_run(meas, write_period=5, **kwargs):
+    meas.write_period = write_period  # seconds of results written per transaction
+    if 'in_memory_cache' in inspect.signature(meas.run).parameters:  # QCoDeS 0.37 and newer
+        kwargs.setdefault('in_memory_cache', False)
+    return meas.run(write_in_background=True, **kwargs)
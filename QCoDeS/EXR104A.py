@@ -0,0 +1,119 @@
+# --------------------------------------------------------
+# Keysight EXR104A Mixed Signal Oscilloscope: 1GHz, 16GSa/s, 10 bit
+# QCoDeS driver: KeysightInfiniium with fast binary trace transfer
+#  --------------------------------------------------------
+
+# =============================================
+# README
+# =============================================
+
+# What this adds to KeysightInfiniium
+# ------------------------
+# ch1.word_trace ... ch4.word_trace: traces read as 16 bit WORD binary blocks, decoded straight from the
+#                                    received bytes into numpy (no copy of the raw data, one pass to scale it)
+# time_axis: setpoints of every trace, only rebuilt when the points or the timebase (x increment/origin) change
+#            (no update_setpoints()/cache_setpoints bookkeeping, the preamble comes with every trace)
+# acquire(): one :DIGitize of every displayed channel, then every trace read off that same acquisition
+
+# Example
+# ------------------------
+# from EXR104A import EXR104A
+# os = EXR104A(name='os', address=KEYSIGHT_ADDRESS, timeout=10, channels=4, silence_pyvisapy_warning=True)
+# os.ch3.word_trace.get()                              # one channel (digitizes first if auto_digitize is on)
+# datasaver.add_result(*os.acquire())                  # all displayed channels off one digitize
+
+
+# =============================================
+# Imports
+# =============================================
+
+import numpy as np
+
+from qcodes.instrument.parameter import Parameter, ParameterWithSetpoints
+from qcodes.instrument_drivers.Keysight import KeysightInfiniium
+from qcodes.utils.validators import Arrays
+
+
+# =============================================
+# Parameters
+# =============================================
+
+# Trace of one channel, transferred as WORD binary and scaled with the channel's preamble
+class WordTrace(ParameterWithSetpoints):
+
+    def __init__(self, name, source, **kwargs):
+        super().__init__(name, **kwargs)
+        self.source = source  # e.g. 'CHAN3'
+
+    def get_raw(self):
+        scope = self.root_instrument
+        if scope.auto_digitize():
+            scope.digitize()  # new acquisition of this channel, as the stock trace does
+        return scope.read_trace(self.source)
+
+
+# =============================================
+# Instrument Driver
+# =============================================
+
+# KeysightInfiniium for the EXR104A, with WORD binary traces and cached setpoints
+class EXR104A(KeysightInfiniium):
+
+    def __init__(self, name, address, **kwargs):
+        super().__init__(name, address, **kwargs)
+
+        self._points = 0  # points of the last trace read
+        self._axis_key = None  # (points, x increment, x origin, x reference) the cached axis was built for
+        self._axis = np.array([])
+
+        # KeysightInfiniium already sets the transfer to WORD, LSBFirst (numpy's native order), streaming ('#0' blocks)
+        self.add_parameter('trace_points', label='Trace points', unit='#',
+                           get_cmd=lambda: self._points)  # length of the last trace, shape of every trace
+        self.add_parameter('time_axis', label='Time', unit='s', parameter_class=Parameter,
+                           get_cmd=lambda: self._axis,
+                           vals=Arrays(shape=(self.trace_points,)))  # cached setpoints of every trace
+
+        for n, channel in enumerate(self.channels, start=1):
+            channel.add_parameter('word_trace', label=f'Channel {n}', unit='V', parameter_class=WordTrace,
+                                  source=f'CHAN{n}', setpoints=(self.time_axis,),
+                                  vals=Arrays(shape=(self.trace_points,)))
+
+    # Reads the last acquisition of one source (e.g. 'CHAN3') without digitizing
+    def read_trace(self, source):
+        # Source and its preamble in one round trip
+        preamble = self.ask(f":WAVeform:SOURce {source};:WAVeform:PREamble?").strip().split(',')
+        points = int(preamble[2])
+        x_increment, x_origin, x_reference = (float(value) for value in preamble[4:7])
+        y_increment, y_origin = (float(value) for value in preamble[7:9])
+
+        # Binary block: 2*points bytes read in large chunks, wrapped by pyvisa with np.frombuffer (no copy)
+        self.write(":WAVeform:DATA?")
+        self.visa_handle.read_bytes(2)  # '#0' header of a streamed block
+        raw = self.visa_handle.read_binary_values('h', is_big_endian=False, container=np.ndarray, header_fmt='empty',
+                                                  expect_termination=True, data_points=points,
+                                                  chunk_size=max(2 * points + 64, 20 * 1024))
+        data = np.multiply(raw, y_increment, dtype=np.float64)  # int16 to volts: the one new array of the trace
+        data += y_origin  # offset added in place, no second copy
+
+        # Setpoints: rebuilt only when the points or the timebase changed
+        key = (len(data), x_increment, x_origin, x_reference)
+        if key != self._axis_key:
+            self._axis = x_origin + (np.arange(len(data)) - x_reference) * x_increment
+            self._axis_key = key
+        self._points = len(data)
+        return data
+
+    # Digitizes the channels (default: every displayed one) at once and reads all of them off that acquisition
+    # Returns (word_trace, values) pairs, e.g. datasaver.add_result(*os.acquire())
+    def acquire(self, channels=None):
+        if channels is None:
+            channels = [channel for channel in self.channels if channel.display()]
+        sources = ','.join(channel.word_trace.source for channel in channels)
+        self.ask(f":DIGitize {sources};*OPC?")  # one acquisition of every channel, returns when it is complete
+
+        results = []
+        for channel in channels:
+            values = self.read_trace(channel.word_trace.source)
+            channel.word_trace.cache.set(values)  # latest trace, also for snapshots
+            results.append((channel.word_trace, values))
+        return results
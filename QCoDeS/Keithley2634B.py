@@ -0,0 +1,150 @@
+# --------------------------------------------------------
+# Keithley 2634B System Source Meter Unit: 2-channel, 1fA, 10A pulse, 6.5bit
+# QCoDeS driver: Keithley2634B with voltage sweeps run by the instrument's trigger model
+#  --------------------------------------------------------
+
+# =============================================
+# README
+# =============================================
+
+# What this adds to Keithley2634B
+# ------------------------
+# setup_sweep(): sends the levels of a voltage sweep (any array: np.linspace, an up and down loop, ...) to the instrument
+#                once, as the source list of the channel's trigger model
+# smua.iv_sweep, smub.iv_sweep: runs the programmed sweep with one trigger and returns every current, read back from the
+#                               buffer as one REAL64 binary block (no set/get round trip per point); the output is on only
+#                               while the sweep runs, it is turned off at the end and after any error
+# smua.sweep_axis, smub.sweep_axis: setpoints of iv_sweep, the levels of the last setup_sweep()
+# A 2-D map (gate steps, drain sweep) is one trigger and one dataset write per gate step
+
+# Example
+# ------------------------
+# from Keithley2634B import Keithley2634B
+# smu = Keithley2634B(name='smu', address=SMU_ADDRESS)
+# smu.setup_sweep('smub', np.linspace(0, 1, 101), nplc=0.1)      # drain sweep, programmed once
+# meas.register_parameter(smu.smua.volt)
+# register_traces(meas, [smu.smub.iv_sweep], setpoints=[smu.smua.volt])
+# with fast_run(meas) as datasaver:
+#     for vgs in np.linspace(-1, 1, 21):
+#         smu.smua.volt(vgs)
+#         datasaver.add_result((smu.smua.volt, vgs), (smu.smub.iv_sweep, smu.smub.iv_sweep()))
+
+
+# =============================================
+# Imports
+# =============================================
+
+import numpy as np
+
+from qcodes.instrument.parameter import Parameter, ParameterWithSetpoints
+from qcodes.instrument_drivers.Keithley import Keithley2634B as Keithley2634BBase
+from qcodes.utils.validators import Arrays
+
+
+# =============================================
+# Parameters
+# =============================================
+
+# Currents of the sweep programmed on one channel, one trigger per get
+class SweepCurrent(ParameterWithSetpoints):
+
+    def __init__(self, name, source, **kwargs):
+        super().__init__(name, **kwargs)
+        self.source = source  # e.g. 'smub'
+
+    def get_raw(self):
+        return self.root_instrument.run_sweep(self.source)
+
+
+# =============================================
+# Instrument Driver
+# =============================================
+
+# Keithley2634B with list sweeps executed by the trigger model and read back in binary
+class Keithley2634B(Keithley2634BBase):
+
+    def __init__(self, name, address, **kwargs):
+        super().__init__(name, address, **kwargs)
+
+        self._sweeps = {}  # channel ('smua'/'smub') -> (levels, seconds per point) of the programmed sweep
+
+        for channel in self.channels:
+            source = channel.channel
+            channel.add_parameter('sweep_points', label='Sweep points', unit='#',
+                                  get_cmd=lambda source=source: len(self.sweep_levels(source)))
+            channel.add_parameter('sweep_axis', label=f'{source} voltage', unit='V', parameter_class=Parameter,
+                                  get_cmd=lambda source=source: self.sweep_levels(source),
+                                  vals=Arrays(shape=(channel.sweep_points,)))  # setpoints of iv_sweep
+            channel.add_parameter('iv_sweep', label=f'{source} current', unit='A', parameter_class=SweepCurrent,
+                                  source=source, setpoints=(channel.sweep_axis,),
+                                  vals=Arrays(shape=(channel.sweep_points,)))
+
+    # Levels of the sweep programmed on a channel (empty before setup_sweep)
+    def sweep_levels(self, source):
+        return self._sweeps.get(source, (np.array([]), 0))[0]
+
+    # Programs a voltage sweep into the trigger model of one channel; nothing runs until iv_sweep is read
+    # delay: settling time before every reading (s), limit: current compliance (A)
+    def setup_sweep(self, source, levels, nplc=0.1, delay=0, limit=1e-3):
+        levels = np.asarray(levels, dtype=float)
+        n = len(levels)
+        if n == 0:
+            raise ValueError('a sweep needs at least one level')
+
+        tsp = [f"sweep_{source} = {{}}"]  # levels sent in chunks, a long list does not fit one line
+        for chunk in range(0, n, 200):
+            tsp += [f"for _,v in ipairs({{{','.join(f'{v:.6g}' for v in levels[chunk:chunk + 200])}}}) do table.insert(sweep_{source},v) end"]
+        tsp += [f"{source}.source.func = {source}.OUTPUT_DCVOLTS",
+                f"{source}.source.limiti = {limit}",
+                f"{source}.measure.nplc = {nplc}",
+                f"{source}.measure.delay = {delay}",
+                f"{source}.measure.autozero = {source}.AUTOZERO_ONCE",  # no autozero reading between points
+                f"{source}.trigger.source.limiti = {limit}",
+                f"{source}.trigger.source.listv(sweep_{source})",
+                f"{source}.trigger.source.action = {source}.ENABLE",
+                f"{source}.trigger.measure.i({source}.nvbuffer1)",
+                f"{source}.trigger.measure.action = {source}.ENABLE",
+                f"{source}.trigger.endpulse.action = {source}.SOURCE_HOLD",  # DC sweep: each level held until the next
+                f"{source}.trigger.endsweep.action = {source}.SOURCE_IDLE",  # back to source.levelv at the end
+                f"{source}.trigger.count = {n}",
+                f"{source}.trigger.arm.count = 1",
+                f"{source}.trigger.arm.stimulus = 0",  # every step starts as soon as the previous one is done
+                f"{source}.trigger.source.stimulus = 0",
+                f"{source}.trigger.measure.stimulus = 0",
+                f"{source}.trigger.endpulse.stimulus = 0",
+                f"{source}.nvbuffer1.collecttimestamps = 0",
+                f"{source}.nvbuffer1.collectsourcevalues = 0"]  # levels are known, only currents are read back
+        for command in tsp:
+            self.write(command)
+
+        linefreq = float(self.ask("print(localnode.linefreq)"))
+        step = delay + nplc / linefreq  # seconds per point, for the read timeout
+        self._sweeps[source] = (levels, step)
+
+    # Runs the sweep programmed on one channel and returns its currents (over range readings as NaN)
+    # The output is on only while the sweep runs: turned off by the script once the trigger model is done, and from here on any error
+    def run_sweep(self, source):
+        if source not in self._sweeps:
+            raise RuntimeError(f'no sweep programmed on {source}: call setup_sweep first')
+        levels, step = self._sweeps[source]
+        n = len(levels)
+
+        # One trigger, then the buffer in one binary block: 8*n bytes read in large chunks, no copy
+        try:
+            self.write(f"{source}.nvbuffer1.clear() {source}.source.output = {source}.OUTPUT_ON {source}.trigger.initiate()")
+            with self.timeout.set_to(self.timeout() + 2 * n * step):  # the reply comes once the sweep is done
+                self.write(f"waitcomplete() {source}.source.output = {source}.OUTPUT_OFF "
+                           f"format.data = format.REAL64 format.byteorder = format.LITTLEENDIAN "
+                           f"printbuffer(1, {n}, {source}.nvbuffer1.readings) format.data = format.ASCII")
+                self.visa_handle.read_bytes(2)  # '#0' header of the binary block
+                data = self.visa_handle.read_binary_values('d', is_big_endian=False, container=np.ndarray,
+                                                           header_fmt='empty', expect_termination=True, data_points=n,
+                                                           chunk_size=max(8 * n + 64, 20 * 1024))
+        except BaseException:
+            self.visa_handle.clear()  # device clear: aborts the sweep still running and drops its unread reply
+            raise
+        finally:
+            self.write(f"{source}.source.output = {source}.OUTPUT_OFF")  # also after a timeout or an interrupted read
+        data = np.array(data)  # writable copy of the received buffer
+        data[np.abs(data) > 9e37] = np.nan  # over range readings
+        return data
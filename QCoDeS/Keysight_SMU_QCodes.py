@@ -47,6 +47,7 @@
 
 import time
 import matplotlib.pyplot as plt
+import numpy as np
 
 # pyvisa:
 import nntplib
@@ -66,12 +67,13 @@ from qcodes.dataset import do0d
 from qcodes.dataset import initialise_database, load_or_create_experiment, plot_dataset, plot_by_id
 from qcodes.dataset.legacy_import import import_dat_file
 from qcodes.dataset.measurements import Measurement
+from Datasaver import register_traces, fast_run  # Traces as binary arrays, batched background writes
+from LiveMonitor import LiveMonitor  # Live plot fed through a queue, bounded frame rate
 
 from qcodes.data.io import DiskIO
 from qcodes.data.location import FormatLocation
 
 from qcodes.loops import Loop
-from qcodes.plots.pyqtgraph import QtPlot
 from qcodes.monitor.monitor import Monitor
 from qcodes.utils.metadata import diff_param_values
 
@@ -87,6 +89,7 @@ KEYSIGHT_ADDRESS = "TCPIP0::169.254.205.81::hislip0::INSTR"
 KEYSIGHT_UTCADDRESS = "TCPIP0::10.44.11.1::inst0::INSTR"
 KEYSIGHT_USB = "USB0::10893::36872::MY61310192::0::INSTR"
 KEYPSU_ADDRESS = "TCPIP0::169.254.144.73::INST0::INSTR"
+SMU_ADDRESS = "TCPIP0::192.168.10.61::inst0::INSTR"
 
 # =============================================
 # Instrument Drivers
@@ -98,18 +101,15 @@ KEYPSU_ADDRESS = "TCPIP0::169.254.144.73::INST0::INSTR"
 # scope.clear()  # Clears the input buffer and output queue, reset parser, clear pending commands
 # scope.write("*rst; status:preset; *cls")  # Performs default setup and clears all status and error registers
 
-# SMU driver
-# from qcodes.instrument_drivers.Keithley.Keithley_2634B import Keithley2634B
-# smu = Keithley2634B(name='smu', address='TCPIP0::192.168.10.61::inst0::INSTR', gates=['smua', 'smub'])
+# SMU driver (Keithley2634B with sweeps run by the instrument, see Keithley2634B.py)
+from Keithley2634B import Keithley2634B
+smu = Keithley2634B(name='smu', address=SMU_ADDRESS)
 
-# OS driver
-from qcodes.instrument_drivers.Keysight import KeysightInfiniium
-os = KeysightInfiniium(name='os', address=KEYSIGHT_ADDRESS, timeout=10,
+# OS driver (KeysightInfiniium with WORD binary traces, see EXR104A.py)
+from EXR104A import EXR104A
+os = EXR104A(name='os', address=KEYSIGHT_ADDRESS, timeout=10,
                        channels=4, silence_pyvisapy_warning=True)  # Timeout in seconds
 
-
-
-smu = DummyInstrument(name='smu', gates=['smua', 'smub'])
 # os = DummyInstrument(name='oscilloscope')
 
 # =============================================
@@ -117,25 +117,25 @@ smu = DummyInstrument(name='smu', gates=['smua', 'smub'])
 # =============================================
 
 # SMU:
-V_appl_1 = Parameter('V_appl_1', label='V_appl_1', unit='V', get_cmd=smu.smua.get,
-                     set_cmd=smu.smua.set)  # source V at channel a
-V_appl_2 = Parameter('V_appl_2', label='V_appl_2', unit='V', get_cmd=smu.smub.get,
-                     set_cmd=smu.smub.set)  # source V at channel b
-V_meas_1 = Parameter('V_meas_1', label='V_meas_1', unit='V', get_cmd=smu.smua.get)  # measure V at channel a
-V_meas_2 = Parameter('V_meas_2', label='V_meas_2', unit='V', get_cmd=smu.smub.get)  # measure V at channel b
-I_appl_1 = Parameter('I_appl_1', label='I_appl_1', unit='A', get_cmd=smu.smua.get,
-                     set_cmd=smu.smua.set)  # source I at channel a
-I_appl_2 = Parameter('I_appl_2', label='I_appl_2', unit='A', get_cmd=smu.smub.get,
-                     set_cmd=smu.smub.set)  # source I at channel b
-I_meas_1 = Parameter('I_meas_1', label='I_meas_1', unit='A', get_cmd=smu.smua.get)  # measure I at channel a
-I_meas_2 = Parameter('I_meas_2', label='I_meas_2', unit='A', get_cmd=smu.smub.get)  # measure I at channel b
+V_appl_1 = Parameter('V_appl_1', label='V_appl_1', unit='V', get_cmd=smu.smua.volt,
+                     set_cmd=smu.smua.volt)  # source V at channel a
+V_appl_2 = Parameter('V_appl_2', label='V_appl_2', unit='V', get_cmd=smu.smub.volt,
+                     set_cmd=smu.smub.volt)  # source V at channel b
+V_meas_1 = Parameter('V_meas_1', label='V_meas_1', unit='V', get_cmd=smu.smua.volt)  # measure V at channel a
+V_meas_2 = Parameter('V_meas_2', label='V_meas_2', unit='V', get_cmd=smu.smub.volt)  # measure V at channel b
+I_appl_1 = Parameter('I_appl_1', label='I_appl_1', unit='A', get_cmd=smu.smua.curr,
+                     set_cmd=smu.smua.curr)  # source I at channel a
+I_appl_2 = Parameter('I_appl_2', label='I_appl_2', unit='A', get_cmd=smu.smub.curr,
+                     set_cmd=smu.smub.curr)  # source I at channel b
+I_meas_1 = Parameter('I_meas_1', label='I_meas_1', unit='A', get_cmd=smu.smua.curr)  # measure I at channel a
+I_meas_2 = Parameter('I_meas_2', label='I_meas_2', unit='A', get_cmd=smu.smub.curr)  # measure I at channel b
 
 # Keysight Oscilloscope:
 nPoints = Parameter('nPoints', label='nPoints', unit='#', set_cmd=os.acquire_points(10_000))  # desired # waveform point
-ch1 = Parameter('ch1', label='ch1', unit='V', get_cmd=os.ch1.trace)  # measure V at channel 1
-ch2 = Parameter('ch2', label='ch2', unit='V', get_cmd=os.ch2.trace)  # measure V at channel 2
-ch3 = Parameter('ch3', label='ch3', unit='V', get_cmd=os.ch3.trace)  # measure V at channel 3
-ch4 = Parameter('ch4', label='ch4', unit='V', get_cmd=os.ch4.trace)  # measure V at channel 4
+ch1 = Parameter('ch1', label='ch1', unit='V', get_cmd=os.ch1.word_trace)  # measure V at channel 1
+ch2 = Parameter('ch2', label='ch2', unit='V', get_cmd=os.ch2.word_trace)  # measure V at channel 2
+ch3 = Parameter('ch3', label='ch3', unit='V', get_cmd=os.ch3.word_trace)  # measure V at channel 3
+ch4 = Parameter('ch4', label='ch4', unit='V', get_cmd=os.ch4.word_trace)  # measure V at channel 4
 
 # Keysight PSU (E36313A):
 
@@ -262,19 +262,16 @@ exp = load_or_create_experiment(exp_name, sample_name)  # Load database
 # Snapshot of the Station in DB (.db)
 meas = Measurement(exp, station)  # Initialize measurement with loaded or created experiment and station
 
-# SMU - setpoints explained: I_meas is a function of "V_appl_1, V_appl_2 ,..."
-# where "V_appl_1, V_appl_2, ..." are known as the setpoints of parameter I_meas
-# meas.register_parameter(V_appl_1)  # smua input parameter - outside sweep
-# meas.register_parameter(V_appl_2)  # smub input parameter - inside sweep
-# meas.register_parameter(I_meas_1, setpoints=[V_appl_1, V_appl_2])  # smua output parameter
-# meas.register_parameter(I_meas_2, setpoints=[V_appl_1, V_appl_2])  # smub output parameter
+# SMU - setpoints explained: the smub current is a function of the smua (gate) voltage and the smub (drain) voltage
+# the drain voltages come with every sweep (iv_sweep's setpoints), so only the gate voltage is registered with it
+map_meas = Measurement(exp, station)  # Separate dataset for the 2-D map
+map_meas.register_parameter(smu.smua.volt)  # smua input parameter - outside sweep
+register_traces(map_meas, [smu.smub.iv_sweep], setpoints=[smu.smua.volt])  # smub sweep, one array per gate step
 
 # OS
 meas.register_parameter(nPoints)  # os input parameter
-# meas.register_parameter(ch1, setpoints=[nPoints])  # os output parameter
-# meas.register_parameter(ch2, setpoints=[nPoints])  # os output parameter
-meas.register_parameter(ch3, setpoints=[nPoints])  # os output parameter
-# meas.register_parameter(ch4, setpoints=[nPoints])  # os output parameter
+# register_traces(meas, [ch1, ch2, ch4], setpoints=[nPoints])  # os output parameters
+register_traces(meas, [ch3], setpoints=[nPoints])  # os output parameter, one binary array per trace
 
 
 # =============================================
@@ -282,20 +279,28 @@ meas.register_parameter(ch3, setpoints=[nPoints])  # os output parameter
 # =============================================
 
 # SMU:
-# Define 1D Loop
-# Sweep parameter V_appl_1 from -1 to 1 at stepping 0.01
-# Delay is wait time for between each step
-# loop = Loop(V_appl_1.sweep(-1,1,0.01), delay = 0.01).each(V_appl1,I_meas,t)
-
-# Define 2D Loop
-# Sweep parameter V_appl_2 from -1 to 1 at 0.01 increments at each step of V_appl_1
-# Delay is wait time for between each steps
-loop = Loop(V_appl_1.sweep(-1, 1, 0.1), delay=0.001).loop(V_appl_2.sweep(-1, 1, 0.1), delay=0.001).each(V_appl_1,
-                                                                                                        V_appl_2,
-                                                                                                        I_meas_1, t)  #
-
-# Run Respective Loop
-# data = loop.get_data_set(name='sweep')
+# 2-D map: smub (drain) swept by the instrument at every smua (gate) step
+# The drain sweep is programmed once, then each gate step is one trigger, one buffer read and one dataset write
+# Delay is settling time before each reading, monitor (optional) shows every sweep as it comes in
+def smu_map(gate_levels, drain_levels, nplc=0.1, delay=0.001, limit=1e-3, monitor=None):
+    smu.setup_sweep('smub', drain_levels, nplc=nplc, delay=delay, limit=limit)  # drain sweep, sent to the SMU once
+    smu.smua.output('on')
+    with fast_run(map_meas) as datasaver:
+        for gate in gate_levels:
+            smu.smua.volt(gate)  # gate step
+            current = smu.smub.iv_sweep()
+            datasaver.add_result((smu.smua.volt, gate), (smu.smub.iv_sweep, current))
+            if monitor is not None:
+                monitor.push(f'Vgs = {gate:.3g} V', smu.smub.sweep_axis(), current)  # queued, frames built on their own thread (see LiveMonitor.py)
+                monitor.pump()  # shows a frame if one is due, otherwise only a clock check
+    smu.smua.output('off')
+    smu.smub.output('off')
+    return datasaver.dataset
+
+# Run 2-D map
+# Sweep V_appl_2 (smub) from -1 to 1 at 0.1 increments at each step of V_appl_1 (smua)
+# with LiveMonitor(title='Ids map', xlabel='Vds (V)', ylabel='Ids (A)', path='./map.png') as map_live:
+#     map_dataset = smu_map(np.linspace(-1, 1, 21), np.linspace(-1, 1, 21), monitor=map_live)
 
 
 # OS:
@@ -313,24 +318,29 @@ meas.add_before_run(os_setup, args=())
 meas.add_after_run(os_cleanup, args=())
 # os.ch3.cache_setpoints = True
 
-with meas.run() as datasaver:
-    for nPointstest in [100, 1_000, 10_000, 50_000]:
-        # os.write_raw(":ACQuire:SRATe:ANALog AUTO")
-        # os.ch3.update_setpoints()
-        time.sleep(1)
-        os.acquire_points(nPointstest)  # Capture acquisition
-        # os.acquire_interpolate(0)
-        # os.sample_rate(nPoints / os.timebase_range())  # Required sample rate
-        os.digitize()
-        # print(os.ch3.trace.get())
-        # # os.auto_digitize()
-        df = pd.DataFrame(os.ch3.trace.get())
-        df.to_csv(f"{nPointstest}.csv")
-        # datasaver.add_result((nPoints,nPointstest),
-        #                      (ch3, os.ch3.trace.get()))
-        # datasaver.add_result(os.ch3.trace.get())
-
-# dataset = datasaver.dataset
+def os_measure(monitor=None):
+    with fast_run(meas) as datasaver:  # add_result only buffers, a background thread writes every few seconds
+        for nPointstest in [100, 1_000, 10_000, 50_000]:
+            # os.write_raw(":ACQuire:SRATe:ANALog AUTO")
+            # os.ch3.update_setpoints()
+            time.sleep(1)
+            os.acquire_points(nPointstest)  # Capture acquisition
+            # os.acquire_interpolate(0)
+            # os.sample_rate(nPoints / os.timebase_range())  # Required sample rate
+            os.digitize()
+            # print(os.ch3.trace.get())
+            # # os.auto_digitize()
+            trace = ch3.get()
+            datasaver.add_result((nPoints, nPointstest), (ch3, trace))  # into experiments.db, no csv per point count
+            if monitor is not None:
+                monitor.push(f'{nPointstest} points', os.time_axis(), trace)  # queued, frames built on their own thread (see LiveMonitor.py)
+                monitor.pump()  # shows a frame if one is due, otherwise only a clock check
+    return datasaver.dataset
+
+# Live plotting: frames built on their own thread at most 10 times a second, shown in a window or saved to ./live.png
+# the measurement only queues traces and pumps the window
+with LiveMonitor(title='ch3', xlabel='Time (s)', ylabel='ch3 (V)', fps=10, path='./live.png') as live:
+    dataset = os_measure(monitor=live)
 # time.sleep(5)
 # # print(dataset.to_pandas_dataframe().head())
 # CH3_df = dataset.to_pandas_dataframe_dict()["ch3"]
@@ -354,9 +364,6 @@ loc = loc_provider(DiskIO("."), record=rcd)  # Saving data in location provided
 # import_dat_file(loc,exp)                                    # Import .dat file's data into database
 
 
-exit()
-
-
 # =============================================
 # Plotting
 # =============================================
@@ -365,11 +372,8 @@ exit()
 # monitor = qc.Monitor(V_appl_1,V_appl_2,I_meas,t)
 
 
-# Live
-plot = QtPlot()  # Make plot
-plot.add(data.I)  # Add data to plot
-_ = loop.with_bg_task(plot.update).run()  # Live plotting
-plot.save('./graph.png')  # Save plot
+# Live (see Measurements)
+live.save('./graph.png')  # Save the last frame of the live plot
 
 # =============================================
 # Cleanup
@@ -0,0 +1,205 @@
+# --------------------------------------------------------
+# Live plotting of running measurements
+#  --------------------------------------------------------
+
+# =============================================
+# README
+# =============================================
+
+# What this does
+# ------------------------
+# push():  called by the measurement, only appends to a deque (atomic, no lock, no drawing): costs under a microsecond
+#          arrays (traces, sweeps) replace the line of that name, single values are added to it
+# Frames:  a thread of its own takes whatever was pushed since the last frame and decimates it, at most fps times a
+#          second and spaced so this takes at most share of the time; it never touches a GUI toolkit
+#          (the measurement stays on its thread: QCoDeS datasets can only be written from the thread that opened the db)
+# Window:  with a display the figure is a normal pyplot window owned by the main thread; pump() in the measurement
+#          loop shows the latest frame when one is due (a clock check otherwise) and keeps the window responsive
+# Headless: without a display (or off the main thread) the frame thread draws with Agg and saves path every frame
+# Traces longer than the plot is wide are drawn as the min and max of each pixel column (same picture, ~2000 points)
+
+# Example
+# ------------------------
+# from LiveMonitor import LiveMonitor
+# with LiveMonitor(title='ch3', xlabel='Time (s)', ylabel='ch3 (V)', path='./live.png') as live:
+#     with fast_run(meas) as datasaver:
+#         for n in [100, 1_000, 10_000]:
+#             trace = ch3.get()
+#             datasaver.add_result((nPoints, n), (ch3, trace))
+#             live.push(f'{n} points', os.time_axis(), trace)
+#             live.pump()
+# live.save('./graph.png')
+
+
+# =============================================
+# Imports
+# =============================================
+
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# =============================================
+# Functions
+# =============================================
+
+# Min and max of y in each of bins columns of x (points in x order), for lines longer than the screen is wide
+def decimate(x, y, bins):
+    n = len(y)
+    if n <= 2 * bins:
+        return x, y
+    size = -(-n // bins)  # points per column
+    bins = -(-n // size)  # columns actually filled
+    pad = size * bins - n
+    columns = np.concatenate([y, np.full(pad, np.nan)]).reshape(bins, size)  # padding ignored by nanmin/nanmax
+    starts = x[::size]
+    low, high = np.nanmin(columns, axis=1), np.nanmax(columns, axis=1)
+    return np.repeat(starts, 2), np.column_stack([low, high]).ravel()  # a vertical stroke per column
+
+
+# =============================================
+# Live Monitor
+# =============================================
+
+# Figure fed from the measurement through a lock free queue; frames built at a bounded rate on their own thread
+class LiveMonitor:
+
+    def __init__(self, title='', xlabel='', ylabel='', fps=10, share=0.1, xscale='linear', yscale='linear', path=None):
+        self.queue = collections.deque()  # (name, x, y) pushed by the measurement, taken by the frame thread
+        self.period = 1 / fps  # shortest time between frames
+        self.share = share  # largest fraction of the time spent on frames
+        self.labels = dict(title=title, xlabel=xlabel, ylabel=ylabel, xscale=xscale, yscale=yscale)
+        self.path = path  # png saved every frame when headless
+        self.data = {}  # name -> [x, y] of every line, only touched by the frame thread
+        self.decimated = {}  # name -> decimated x, y of every line, redone only for lines that changed
+        self.frame = (0, {})  # (number, name -> decimated x, y): replaced whole by the frame thread, read by pump()
+        self.shown = 0  # number of the frame on screen
+        self.due = 0  # perf_counter time of the next pump() that shows a frame
+        self.bins = 2000  # pixel columns of the plot
+        self.fig = None
+        self.window = False
+        self.done = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # From the measurement: one trace (x and y arrays) or one point (x and y values) of the line called name
+    def push(self, name, x, y):
+        self.queue.append((name, x, y))
+
+    # Opens the figure (a window if there is a display and this is the main thread) and starts the frame thread
+    def start(self):
+        import matplotlib.pyplot as plt  # only when a monitor is used: importing this module needs no GUI
+
+        if threading.current_thread() is threading.main_thread():
+            self.fig = plt.figure(figsize=(8, 5))
+            self.window = self.fig.canvas.required_interactive_framework is not None  # None: Agg, no display
+            if not self.window:
+                plt.close(self.fig)  # kept out of pyplot: drawn by the frame thread
+        if not self.window:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            self.fig = Figure(figsize=(8, 5))
+            FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.set(**self.labels)
+        self.ax.grid(True)
+        self.lines = {}  # name -> line artist, drawn by whoever owns the figure
+        self.bins = max(int(self.ax.bbox.width), 1)
+        if self.window:
+            plt.show(block=False)
+
+        self.done.clear()
+        self.thread = threading.Thread(target=self.loop, name='LiveMonitor', daemon=True)
+        self.thread.start()
+
+    # Builds the last frame and shows or saves it
+    def close(self):
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.window:
+            self.pump(force=True)
+
+    def save(self, path):
+        self.fig.savefig(path)
+
+    # Main thread, window only: shows the latest frame if one is due, otherwise only a clock check
+    def pump(self, force=False):
+        if not self.window or (not force and time.perf_counter() < self.due):
+            return
+        start = time.perf_counter()
+        number, lines = self.frame
+        if number != self.shown:
+            self.draw(lines)
+            self.fig.canvas.draw_idle()
+            self.shown = number
+        self.fig.canvas.flush_events()  # window events and the draw
+        busy = time.perf_counter() - start
+        self.due = time.perf_counter() + max(self.period - busy, busy * (1 / self.share - 1))
+
+    # Frame thread: a frame every period (less often if frames are slow) until close()
+    def loop(self):
+        number = 0
+        while True:
+            start = time.perf_counter()
+            last = self.done.is_set()  # one more frame after close() for everything pushed before it
+            lines = self.update()
+            if lines is not None:
+                number += 1
+                self.frame = (number, lines)  # one reference swap, pump() sees the old or the new frame whole
+                if not self.window:
+                    self.draw(lines)
+                    if self.path:
+                        self.render(self.path)
+            if last:
+                break
+            busy = time.perf_counter() - start
+            self.done.wait(max(self.period - busy, busy * (1 / self.share - 1), 1e-3))
+
+    # Saves the figure through a temporary file, so a viewer never shows half a png
+    def render(self, path):
+        temporary = path + '.tmp'
+        self.fig.savefig(temporary, format=os.path.splitext(path)[1][1:] or 'png')
+        os.replace(temporary, path)
+
+    # Moves everything pushed since the last frame onto the lines, returns the decimated lines (None if nothing came in)
+    def update(self):
+        pushed = {}  # name -> traces and points taken off the queue, in order
+        while self.queue:
+            name, x, y = self.queue.popleft()
+            pushed.setdefault(name, []).append((x, y))
+        if not pushed:
+            return None
+
+        for name, items in pushed.items():
+            entry = self.data.setdefault(name, [np.array([]), np.array([])])
+            last = max((i for i, (x, y) in enumerate(items) if np.ndim(y)), default=-1)  # only the latest trace is drawn
+            if last >= 0:
+                entry[0], entry[1] = np.asarray(items[last][0], dtype=float), np.asarray(items[last][1], dtype=float)
+            points = items[last + 1:]
+            if points:
+                entry[0] = np.concatenate([entry[0], [x for x, y in points]])  # one concatenate per frame, not per point
+                entry[1] = np.concatenate([entry[1], [y for x, y in points]])
+            self.decimated[name] = decimate(entry[0], entry[1], self.bins)
+        return dict(self.decimated)
+
+    # Puts a frame on the axes (main thread with a window, frame thread without)
+    def draw(self, lines):
+        for name, (x, y) in lines.items():
+            if name not in self.lines:
+                self.lines[name], = self.ax.plot([], [], label=name)
+            self.lines[name].set_data(x, y)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.ax.legend(loc='best')
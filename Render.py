@@ -0,0 +1,55 @@
+# Batch rendering of plots in a pool of worker processes on the Agg backend
+# Works for SMU.Graph / SMU.Overlay and GraphCSV.Graph jobs
+
+import importlib
+import multiprocessing
+import sys
+import time
+
+# One figure to render: module, class and its arguments (dataset + styling), then the plot method to call
+class Job:
+    def __init__(self,module,args,plot,kwargs=None,plot_kwargs=None,savefile=None,cls='Graph'):
+        self.module = module                                                    # 'SMU' or 'GraphCSV'
+        self.args = tuple(args) if isinstance(args,(list,tuple)) else (args,)   # Sheet name or csv path (+ labels for GraphCSV)
+        self.plot = plot                                                        # Method name e.g. 'Loops' or 'Overlay'
+        self.kwargs = kwargs or {}                                              # Styling given to the class e.g. title, xscale
+        self.plot_kwargs = plot_kwargs or {}                                    # Arguments of the plot method e.g. multi_x
+        self.savefile = savefile                                                # Save location, module default if None
+        self.cls = cls                                                          # 'Graph', 'Overlay', ...
+
+    def __repr__(self):
+        return f"Job({self.module}.{self.cls}({', '.join(map(repr,self.args))}).{self.plot})"
+
+def Agg():
+    import matplotlib
+    matplotlib.use('Agg',force=True)                                            # No windows in the workers
+
+def Work(job):
+    import matplotlib.pyplot as plt
+    start = time.perf_counter()
+    error = None
+    try:
+        module = importlib.import_module(job.module)
+        if job.savefile is not None:
+            module.savefile = job.savefile                                      # Workers don't see changes made in the main process
+        graph = getattr(module,job.cls)(*job.args,**job.kwargs)
+        getattr(graph,job.plot)(**job.plot_kwargs)
+    except Exception as e:                                                      # One bad file doesn't stop the batch
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        plt.close('all')                                                        # Every figure closed, worker memory stays flat
+    return job, time.perf_counter()-start, error
+
+# Render every job, one process per core by default; returns (job, seconds, error) in job order
+def Render(jobs,processes=None,verbose=True):
+    jobs = list(jobs)
+    for job in jobs:
+        if job.savefile is None and job.module in sys.modules:
+            job.savefile = sys.modules[job.module].savefile                     # Pass on savefile set in this session
+    results = []
+    with multiprocessing.Pool(processes,initializer=Agg) as pool:
+        for job,seconds,error in pool.imap(Work,jobs,chunksize=1):              # chunksize 1 balances uneven plot costs, results come in job order
+            if verbose:
+                print(f"{job}: {'FAILED ' + error if error else 'done'} ({seconds:0.2f} s)",flush=True) # As each job is collected, not at the end
+            results.append((job,seconds,error))
+    return results
@@ -1,15 +1,23 @@
 # SMU code by John Barney
 # with support from Lucas Nichols
 
-from keithley2600 import Keithley2600
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 from matplotlib import gridspec
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 import warnings
 import time
+import os
+import math
+import functools
+import json
+import threading
+import concurrent.futures
 from datetime import datetime
+import Analysis
 
 # removing unnecessary warnings APPEND WILL BE REPLACED WITH CONCAT IN PANDAS IN THE FUTURE
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -22,217 +30,515 @@ def help():
 SMU.Settings(0.001)\n\
 SMU.Test('IRFZ44N_box_AloopB').AloopB(0.5,2,0.5,0,1.2,0.1)\n\
 SMU.Test('IRFZ44N_box_BloopA').BloopA(0,1.2,0.4,0.5,2,0.1)\n\
+SMU.Test('IRFZ44N_box_Policy').BloopA(0,1.2,0.4,0,5,0.1,policy=SMU.Policy(noise=1e-3))\n\
+SMU.Test('IRFZ44N_box_Adaptive').BloopA(0,1.2,0.4,0,5,0.25,tol=1e-3,max_points=300)\n\
+SMU.Test('IRFZ44N_box_AloopB').Resume()\n\
+SMU.Lot().Add(ip1,'dev1_BloopA','BloopA',0,1.2,0.4,0.5,2,0.1).Add(ip2,'dev2_BloopA','BloopA',0,1.2,0.4,0.5,2,0.1).Run()\n\
+SMU.Test('IRFZ44N_box_Pulsed').PulsedBloopA(0,1.2,0.4,0,5,0.1,width=500e-6,duty=0.01)\n\
+SMU.Test('IRFZ44N_box_Hysteresis').HysteresisBloopA(0,1.2,0.4,0,5,0.1,step=20e-3)\n\
+SMU.Test('IRFZ44N_box_Log',store='parquet').TimeTest(2.75,0.5,5000)\n\
+SMU.Load('IRFZ44N_box_Log',columns=['Time (s)','Ids (A)'])\n\
 SMU.Test('IRFZ44N_box_TimeTest').TimeTest(2.75,0.5,5000)\n\
 SMU.Graphs_Overlay('IRFZ44N_box_AloopB','IRFZ44N_box_BloopA').Loops_Overlay()\n\
+SMU.Overlay('dev1_BloopA','dev2_BloopA','dev3_BloopA').Loops(grid=True)\n\
+Render.Render([Render.Job('SMU','IRFZ44N_box_AloopB','Loops'),Render.Job('SMU','IRFZ44N_box_BloopA','Loop_and_Transconductance')])\n\
 SMU.Graph('IRFZ44N_box_AloopB').Loops()\n\
 SMU.Graph('IRFZ44N_box_BloopA').Loops()\n\
 SMU.Format('IRFZ44N_box_BloopA').AddTransconductance()\n\
+SMU.Format('IRFZ44N_box_AloopB').AddOutputConductance()\n\
 SMU.Graph('IRFZ44N_box_BloopA').Loop_and_Transconductance()\n\
 SMU.Graph('IRFZ44N_box_BloopA').Transconductance())\n\
+SMU.Pipeline('IRFZ44N_box_BloopA').AddTransconductance().Plot('Loops','Transconductance').Run()\n\
+SMU.Pipeline('IRFZ44N_box_BloopA').RemoveNAN().Extract(icc=1e-7).Run()\n\
+SMU.Format('IRFZ44N_box_AloopB').Extract()\n\
     ")
 
 # Note: USE / for \ in file path
 savefile = "Desktop" # where to save file
 ip = 'TCPIP0::192.168.10.61::inst0::INSTR'
 
+# Opens a session to the SMU at ip (keithley2600 only needed once an instrument is used)
+def Connect(ip):
+    from keithley2600 import Keithley2600
+    return Keithley2600(ip)                                                 # Connect to SMU via IP
+
+# The module SMU: connects on first use to the current SMU.ip, so importing SMU for graphs or analysis needs no instrument
+class Instrument:
+    def __init__(self):
+        self.__dict__['session'] = None                                     # Keithley2600 once connected
+        self.__dict__['address'] = None                                     # ip the session was opened with
+
+    def Session(self):
+        if self.session is None or self.address != ip:                     # First use, or SMU.ip changed since
+            self.Disconnect()
+            self.__dict__['session'] = Connect(ip)
+            self.__dict__['address'] = ip
+        return self.session
+
+    def __getattr__(self,name):
+        if name.startswith('__'):
+            raise AttributeError(name)                                      # copy/pickle probing must not connect
+        return getattr(self.Session(),name)                                 # e.g. SMU.smua, SMU.apply_voltage
+
+    def __setattr__(self,name,value):
+        setattr(self.Session(),name,value)
+
+    def Disconnect(self):
+        if self.session is not None:
+            self.session.disconnect()
+            self.__dict__['session'] = None
+        return
+
 # Connect Instrument
-SMU = Keithley2600(ip)                                                      # Connect to SMU via IP
+SMU = Instrument()                                                          # Connects to SMU via IP when first used
 
-def Settings(nplc):
+integration = None                                                          # nplc set by Settings(), saved in checkpoints
+
+def Settings(nplc,smu=None):
     # SMU settings
-    SMU.set_integration_time(SMU.smub, nplc)                                # nplc = integration time: 0.001 to 25
+    global integration
+    integration = nplc                                                      # remembered for checkpoints
+    smu = SMU if smu is None else smu                                       # module SMU unless a bench session is given
+    smu.smua.measure.nplc = nplc                                            # nplc = integration time: 0.001 to 25 power line cycles
+    smu.smub.measure.nplc = nplc                                            # (set_integration_time takes seconds, not nplc)
     print(f"SMU nplc set to {nplc}")
 
+# numpy values as python numbers and lists for json, anything else as its text
+def Plain(value):
+    return value.tolist() if isinstance(value,(np.generic,np.ndarray)) else str(value)
+
+# Measure ranges of the 2634B, smallest first
+Recorded = ['NPLC','Range (A)','Range (V)','Direction']                     # Columns on how a reading was taken (policy settings, sweep direction), kept after the measured ones
+Ranges = {'i': [1e-9,1e-8,1e-7,1e-6,1e-5,1e-4,1e-3,1e-2,1e-1,1,1.5],   # Current ranges (A)
+          'v': [0.2,2,20,200]}                                             # Voltage ranges (V)
+
+# Measurement policy: nplc and range chosen per point from the expected reading, instead of one global Settings(nplc)
+# noise: target relative noise of every reading, floor: instrument noise as a fraction of range at 1 nplc
+class Policy:
+    def __init__(self,noise=1e-3,floor=2e-5,nplc_min=0.001,nplc_max=25,headroom=1.05,retries=2,ranges=None):
+        self.noise = noise                                                      # Wanted precision, e.g. 1e-3 = 0.1%
+        self.floor = floor                                                      # Noise on a range is about floor*range/sqrt(nplc)
+        self.nplc_min = nplc_min                                                # Fastest integration allowed
+        self.nplc_max = nplc_max                                                # Slowest integration allowed
+        self.headroom = headroom                                                # Reading may grow this much before it overflows the range
+        self.retries = retries                                                  # Extra readings when the guess was off (range overflows not counted)
+        self.ranges = ranges                                                    # None: ranges of the 2634B for what is measured
+        self.params = dict(noise=noise,floor=floor,nplc_min=nplc_min,nplc_max=nplc_max,headroom=headroom,retries=retries,ranges=ranges) # saved in checkpoints
+        return
+
+    def Attach(self,smu,func='i'):
+        self.smu = smu                                                          # Smu doing the measuring
+        self.func = func                                                        # 'i' or 'v', what the smu measures
+        self.range_list = np.array(self.ranges if self.ranges is not None else Ranges[func],dtype=float)
+        self.name = 'Range (A)' if func == 'i' else 'Range (V)'                 # Column the range is recorded in
+        self.nplc = None                                                        # What is set on the instrument, to skip repeated writes
+        self.range = None
+        return self
+
+    def Choose(self,guess):
+        size = abs(guess)*self.headroom
+        rng = self.range_list[min(np.searchsorted(self.range_list,size),len(self.range_list)-1)] # Smallest range that holds the reading
+        nplc = (self.floor*rng/(self.noise*max(abs(guess),rng*1e-6)))**2         # Integration that brings range noise down to noise*reading
+        nplc = float(np.clip(np.round(nplc,3),self.nplc_min,self.nplc_max))
+        return nplc, float(rng)
+
+    def Set(self,nplc,rng):
+        if nplc != self.nplc:
+            self.smu.measure.nplc = nplc                                        # Only write settings that changed
+            self.nplc = nplc
+        if rng != self.range:
+            setattr(self.smu.measure,'autorange'+self.func,self.smu.AUTORANGE_OFF) # Fixed range, autorange would override it
+            setattr(self.smu.measure,'range'+self.func,rng)
+            self.range = rng
+        return
+
+    def Autorange(self,meas):
+        setattr(self.smu.measure,'autorange'+self.func,self.smu.AUTORANGE_ON)   # One quick autoranged reading to find the magnitude
+        self.smu.measure.nplc = self.nplc_min
+        self.nplc = self.range = None
+        return meas()
+
+    def Measure(self,meas,guess=None):
+        if guess is None or not np.isfinite(guess):
+            guess = self.Autorange(meas)                                        # Nothing to go on
+        retries = 0
+        while True:
+            nplc, rng = self.Choose(guess)
+            self.Set(nplc,rng)
+            value = meas()
+            if abs(value) > rng*1.01:                                           # Overflow (9.91e37) or above range
+                if rng >= self.range_list[-1]:
+                    value = np.nan                                              # Overflowing on the top range itself, dropped by RemoveNAN
+                    break
+                guess = max(self.Autorange(meas),rng*self.headroom*1.01)        # Straight to the reading's range, at least one up: not a retry
+                continue
+            if (nplc,rng) == self.Choose(value) or self.floor*rng/math.sqrt(nplc) <= 1.5*self.noise*abs(value):
+                break                                                           # Settings were right for this reading, or precise enough anyway
+            if retries == self.retries:
+                break                                                           # Good reading on its range, only less precise than wanted
+            retries += 1
+            guess = value                                                       # Reading was far from the guess: measure again with its settings
+        return value, {'NPLC': nplc, self.name: rng}
+
 # class for holding all the various tests
 class Test:
-    def __init__(self,name): # inital parameters given to object of class Test
-        print('\nFor MOSFET: attach Vgs to SMUA & Vds to SMUB\n') # how 3 terminal device must be plugged in to SMU
+    def __init__(self,name,smu=None,plot=True,verbose=True,interval=1,store='csv'): # inital parameters given to object of class Test
+        if store not in Stores:
+            raise Exception(f"store must be one of {list(Stores)}")
+        self.smu = SMU if smu is None else smu                  # instrument session, module SMU unless given (one per bench, see Lot)
+        self.plot = plot                                        # False: graphs are left to the caller (self.plots), e.g. after threads join
+        self.verbose = verbose                                  # False: no console output, e.g. several tests at once
+        self.plots = []                                         # graphs of this test
+        self.interval = interval                                # seconds between progress lines
+        self.progress = Progress(0,interval,False,name=name)    # points/sec, ETA and phase times of the running test
+        self.Log('\nFor MOSFET: attach Vgs to SMUA & Vds to SMUB\n') # how 3 terminal device must be plugged in to SMU
         self.name = name
-        self.save = savefile+self.name+'.csv' # path and name of csv file to call in one: self.save
+        self.save = Savepath(self.name) # path and name of csv file to call in one: self.save
+        self.checkpoint = os.path.splitext(self.save)[0]+'.json' # sweep progress and settings, for Resume()
+        self.store = Savepath(self.name,Stores[store])          # finished sheet, the csv above is only the journal while measuring if columnar
+        self.resume = None                                      # checkpoint being resumed from
+        self.manifest = {}
 
     # For loop where SMUa steps up and SMUb sweeps per step
-    def AloopB(self,smua_in1,smua_in2,smua_incr,smub_in1,smub_in2,smub_incr,delay=0,smua_in_type='v',smub_in_type='v',smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)'):
+    def AloopB(self,smua_in1,smua_in2,smua_incr,smub_in1,smub_in2,smub_incr,delay=0,smua_in_type='v',smub_in_type='v',smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)',tol=None,max_points=None,atol=1e-12,policy=None):
+        self.Define('AloopB',locals())                                          # saved in the checkpoint
         self.smua_in_name = smua_in_name
         self.smub_in_name = smub_in_name
         self.meas_name = meas_name
 
         # varying smu commands based on v or i supplied
-        apply_smu = 0                                                  # temportary variable to apply voltage/current
-        if smua_in_type == 'v':
-            def smua_apply():                                           # function to apply voltage to smua
-                return SMU.apply_voltage(SMU.smua, apply_smu)                   
-        elif smua_in_type == 'i':
-            def smua_apply():                                           # function to apply current to smua
-                return SMU.apply_current(SMU.smua, apply_smu)                     
-        else:
-            raise Exception('smua_in_type must be \'v\' or \'i\'')
+        smua_apply = self.Source(self.smu.smua,smua_in_type,'smua')             # function to apply voltage/current to smua
+        smub_apply = self.Source(self.smu.smub,smub_in_type,'smub')             # function to apply voltage/current to smub
+        smub_meas = self.Meter(smub_in_type,policy)                             # function to measure current/voltage at smub
 
-        if smub_in_type == 'v':
-            def smub_apply():                                           # function to apply voltage to smub
-                return SMU.apply_voltage(SMU.smub, apply_smu)    
-            def smub_meas():                                            # function to measure current at smub
-                return SMU.smub.measure.i()                             
-            SMU.display.smub.measure.func = SMU.smub.measure.i()        # displaying measrurement on smub
-        elif smub_in_type == 'i':
-            def smub_apply():                                           # function to apply current to smub
-                return SMU.apply_current(SMU.smub, apply_smu)                    
-            def smub_meas():                                            # function to measure voltage at smub
-                return SMU.smub.measure.v()
-            SMU.display.smub.measure.func = SMU.smub.measure.v()        # displaying measurement on smub
-        else:
-            raise Exception('smub_in_type must be \'v\' or \'i\'')
-
-        # fixes divide by 0 error caused by np.arange()
-        if smua_incr == 0:
-            iter_a = 1                                                     # only run for loop once
-            for_outer_arr = smua_in1                                       # only one element in legend                                        
-        else:
-            iter_a = len(np.arange(smua_in1,float(smua_in2+smua_incr),smua_incr))       # how many iterations in for loop
-            for_outer_arr = np.arange(smua_in1,float(smua_in2+smua_incr),smua_incr)     # creates array containing legend elements   
-        if smub_incr == 0:
-            iter_b = 1                                                          # only run loop once
-            for_inner_arr = smub_in1                                            # only one set of elements in x axis               
-        else:
-            iter_b = len(np.arange(smub_in1,float(smub_in2+smub_incr),smub_incr))       # how many iterations in for loop
-            for_inner_arr = np.arange(smub_in1,float(smub_in2+smub_incr),smub_incr)     # creates array for the x axis values         
+        df = self.Sweep(smua_apply,Grid(smua_in1,smua_in2,smua_incr),smua_in_name,smub_apply,Grid(smub_in1,smub_in2,smub_incr),smub_in_name,smub_meas,delay,tol,max_points,atol,policy)
+        return self.Pipeline(df).RemoveNAN().Plot(*self.Plots('Loops')).Run() # Removes NaN's, saves csv once and graphs Loop performed
 
-        # initializes
-        df = pd.DataFrame()                                                     # initializing empty dataframe for storing data in code
-        total = (iter_a*iter_b)+iter_a                                          # calculates total number of iterations
-        count = 0                                                               # initializes counter variable
+    # For loop where SMUb steps up and SMUa sweeps per step
+    def BloopA(self,smub_in1,smub_in2,smub_incr,smua_in1,smua_in2,smua_incr,delay=0,smua_in_type='v',smub_in_type='v',smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)',tol=None,max_points=None,atol=1e-12,policy=None):
+        self.Define('BloopA',locals())                                          # saved in the checkpoint
+        self.smua_in_name = smua_in_name
+        self.smub_in_name = smub_in_name
+        self.meas_name = meas_name
 
-        time_start = datetime.utcnow().strftime('%m-%d-%Y @ %H:%M:%S.%f')[:-3]  # starting time of test
-        print(f"\nStarting time: {time_start}\n")                               
+        # varying smu commands based on v or i supplied
+        smua_apply = self.Source(self.smu.smua,smua_in_type,'smua')             # function to apply voltage/current to smua
+        smub_apply = self.Source(self.smu.smub,smub_in_type,'smub')             # function to apply voltage/current to smub
+        smub_meas = self.Meter(smub_in_type,policy)                             # function to measure current/voltage at smub
 
-        SMU.smua.source.output = SMU.smua.OUTPUT_ON                             # turn on SMUA
-        SMU.smub.source.output = SMU.smub.OUTPUT_ON                             # turn on SMUB
+        df = self.Sweep(smub_apply,Grid(smub_in1,smub_in2,smub_incr),smub_in_name,smua_apply,Grid(smua_in1,smua_in2,smua_incr),smua_in_name,smub_meas,delay,tol,max_points,atol,policy)
+        return self.Pipeline(df).RemoveNAN().AddTransconductance().Plot(*self.Plots('Loop_and_Transconductance')).Run() # Removes NaN's, adds transconductance, saves csv once and graphs
 
-        for a in range(0,iter_a):                                               # loop of smua
-            print(f"{count+1} out of {total}")                                  # iteration counter
-            count = count + 1                                                   # increments counter variable
+    def Log(self,*args):
+        if self.verbose:
+            print(*args)
+        return
 
-            apply_smu = for_outer_arr[a]                                        # setting amount of voltage/current to apply to smu 
-            smua_apply()                                                        # calling apply voltage/current function
-            time.sleep(delay)                                                   # delay the program to limit sample size
+    # Graphs to draw now, or only remember when plot=False
+    def Plots(self,*names):
+        self.plots.extend(names)
+        return names if self.plot else ()
 
-            df = df.append({f"{self.smua_in_name}": for_outer_arr[a]}, ignore_index=True)   # adding the outer for loop value to outer for loop labeled column
-            df.to_csv(self.save, float_format='%.15f')                                      # save dataframe to csv
+    def Source(self,smu,in_type,smu_name):
+        if in_type == 'v':
+            return lambda value: self.smu.apply_voltage(smu,value)              # function to apply voltage to smu
+        elif in_type == 'i':
+            return lambda value: self.smu.apply_current(smu,value)              # function to apply current to smu
+        raise Exception(f'{smu_name}_in_type must be \'v\' or \'i\'')
 
-            for b in range(0,iter_b):                                           # loop of smub
-                print(f"{count+1} out of {total}")                              # iteration counter
-                count = count + 1                                               # increments counter variable
+    def Meter(self,smub_in_type,policy=None):
+        if smub_in_type == 'v':
+            self.smu.display.smub.measure.func = self.smu.smub.measure.i()      # displaying measurement on smub
+            if policy is not None:
+                policy.Attach(self.smu.smub,'i')                                # policy sets nplc and current range of smub
+            return self.smu.smub.measure.i                                      # function to measure current at smub
+        elif smub_in_type == 'i':
+            self.smu.display.smub.measure.func = self.smu.smub.measure.v()      # displaying measurement on smub
+            if policy is not None:
+                policy.Attach(self.smu.smub,'v')                                # policy sets nplc and voltage range of smub
+            return self.smu.smub.measure.v                                      # function to measure voltage at smub
+        raise Exception('smub_in_type must be \'v\' or \'i\'')
+
+    # Steps the outer smu through outer_arr and sweeps the inner smu per step
+    # tol: adaptive mode, inner_arr is only the coarse pass and points are added until a straight line between readings is within tol of the curve
+    #      (fraction of the curve's span, e.g. 1e-3), max_points only caps the total
+    # policy: Policy choosing nplc and range per point, the settings are saved next to every reading
+    # Rows are appended to the csv as they are measured and a checkpoint (.json) records how far the sweep got, see Resume()
+    def Sweep(self,outer_apply,outer_arr,outer_name,inner_apply,inner_arr,inner_name,meas,delay=0,tol=None,max_points=None,atol=1e-12,policy=None):
+        if tol is not None and max_points is None:
+            max_points = 4*len(outer_arr)*len(inner_arr)                        # default cap: 4x the coarse pass
+        budget = max_points//len(outer_arr) if tol is not None else len(inner_arr) # points allowed per curve
+        columns = [outer_name,inner_name,self.meas_name] + (['NPLC',policy.name] if policy is not None else []) # fixed csv columns, rows are only appended
 
-                apply_smu = for_inner_arr[b]                                    # setting amount of voltage/current to apply to smu
-                smub_apply()                                                    # calling apply voltage/current function
-                time.sleep(delay)                                               # delay the program to limit sample size
-                meas = smub_meas()                                              # calling measure voltage/current function
+        # initializes
+        rows = []                                                               # rows measured this session, in sweep order
+        total = (len(outer_arr)*budget)+len(outer_arr)                          # calculates total number of iterations (upper bound if adaptive)
+        start, done, written = self.Start(len(inner_arr)+1,tol)                 # where to continue: outer index, rows of that step on disk, rows on disk
+        self.progress = Progress(total,self.interval,self.verbose,count=written,name=self.name) # throttled counter, rate, ETA and phase times
 
-                df = df.append({f"{self.smub_in_name}": for_inner_arr[b], f"{self.meas_name}": meas}, ignore_index=True) # adding inner for loop and measured values to labeled columns
-                df.to_csv(self.save, float_format='%.15f')                      # save dataframe to csv
+        time_start = datetime.utcnow().strftime('%m-%d-%Y @ %H:%M:%S.%f')[:-3]  # starting time of test
+        self.Log(f"\nStarting time: {time_start}\n")                            
+
+        if self.resume is None:
+            pd.DataFrame(columns=columns).to_csv(self.save)                     # new csv, header only
+            self.Checkpoint(name=self.name,method=self.method,args=self.args,policy=policy.params if policy is not None else None,
+                            sweep={'outer': {'name': outer_name, 'values': list(map(float,outer_arr))},
+                                   'inner': {'name': inner_name, 'values': list(map(float,inner_arr))},
+                                   'meas': self.meas_name, 'tol': tol, 'max_points': max_points, 'atol': atol},
+                            settings={'ip': getattr(self.smu,'visa_address',ip), 'nplc': integration, 'delay': delay},
+                            columns=columns,store=os.path.splitext(self.store)[1],rows=0,next=[0,0],done=0,complete=False,started=time_start)
+        else:
+            self.Log(f"Resuming {self.name} at {outer_name}: {outer_arr[min(start,len(outer_arr)-1)]} ({written} rows on disk)\n")
+
+        count_rows = [written]                                                  # rows on disk, index of the next row
+        def Write(batch,position):                                              # append rows to the csv, then record them in the checkpoint
+            pd.DataFrame(batch,columns=columns,index=range(count_rows[0],count_rows[0]+len(batch))).to_csv(self.save,mode='a',header=False,float_format='%.15f')
+            count_rows[0] += len(batch)
+            rows.extend(batch)
+            self.Checkpoint(rows=count_rows[0],next=position)
+
+        self.smu.smua.source.output = self.smu.smua.OUTPUT_ON                   # turn on SMUA
+        self.smu.smub.source.output = self.smu.smub.OUTPUT_ON                   # turn on SMUB
+
+        for n,outer in enumerate(outer_arr):                                    # loop of outer smu
+            if n < start:
+                continue                                                        # step already on disk
+            progress = self.progress
+            progress.Lap('other')                                               # time outside the phases below
+            outer_apply(outer)                                                  # calling apply voltage/current function (also restores the bias on resume)
+            progress.Lap('source')
+            time.sleep(delay)                                                   # delay the program to limit sample size
+            progress.Lap('settle')
+
+            skip = done if n == start else 0                                    # rows of this step already on disk (outer row + inner points)
+            if tol is None and skip == 0:
+                Write([{outer_name: outer}],[n,0])                              # adding the outer for loop value to outer for loop labeled column
+                progress.Lap('record')
+            progress.Step()                                                     # iteration counter
+
+            x = np.array([],dtype=float)                                        # inner values measured this step
+            y = np.array([],dtype=float)                                        # measured values this step
+            settings = []                                                       # policy settings of every reading this step
+            todo = np.asarray(inner_arr,dtype=float)[max(skip-1,0):]            # coarse pass first (rest of it when resuming)
+            while len(todo):
+                xs, ys = x, y                                                   # curve so far (sorted), to guess readings from
+                for inner in todo:                                              # loop of inner smu
+                    progress.Lap('other')
+                    inner_apply(inner)                                          # calling apply voltage/current function
+                    progress.Lap('source')
+                    time.sleep(delay)                                           # delay the program to limit sample size
+                    progress.Lap('settle')
+                    if policy is None:
+                        value, used = meas(), {}                                # calling measure voltage/current function
+                    else:
+                        guess = np.interp(inner,xs,ys) if len(xs) > 1 else (y[-1] if len(y) else None) # neighbours when refining, else last reading
+                        value, used = policy.Measure(meas,guess)                # measuring with nplc and range picked for this point
+                    progress.Lap('measure')
+                    y = np.append(y,value)
+                    x = np.append(x,inner)
+                    settings.append(used)
+                    if tol is None:
+                        Write([{inner_name: inner, self.meas_name: y[-1], **used}],[n,max(skip-1,0)+len(x)]) # adding inner for loop and measured values to labeled columns
+                    progress.Lap('record')
+                    progress.Step()                                             # iteration counter, printed at most every interval
+                if tol is None:
+                    break
+                order = np.argsort(x)                                           # refined points are measured out of order
+                x, y = x[order], y[order]
+                settings = [settings[i] for i in order]
+                todo = Analysis.Refine(x,y,tol,atol)[:max(budget-len(x),0)]     # new points where the curve needs them, within the cap
+
+            if tol is not None:
+                progress.Lap('other')
+                Write([{outer_name: outer}]+[{inner_name: inner, self.meas_name: value, **used} for inner,value,used in zip(x,y,settings)],[n+1,0]) # whole curve at once, stored in sweep order
+                progress.Lap('record')
+                self.Log(f"{outer_name}: {outer} measured at {len(x)} points")
+            self.Checkpoint(next=[n+1,0],done=n+1)                              # step complete
 
             time_end = datetime.utcnow().strftime('%H:%M:%S.%f')[:-3]           # ending time of test
-            print(f"\nEnding time: {time_end}\n")
-
-        SMU.smua.source.output = SMU.smua.OUTPUT_OFF                            # turn off SMUA
-        SMU.smub.source.output = SMU.smub.OUTPUT_OFF                            # turn off SMUB
+            self.Log(f"\nEnding time: {time_end}\n")
+
+        self.smu.smua.source.output = self.smu.smua.OUTPUT_OFF                  # turn off SMUA
+        self.smu.smub.source.output = self.smu.smub.OUTPUT_OFF                  # turn off SMUB
+        self.Checkpoint(complete=True)
+        self.progress.Finish()                                                  # last progress line, with the phase breakdown
+
+        df = pd.DataFrame(rows,columns=columns)
+        if self.resume is not None:
+            df = pd.concat([self.resume_df,df],ignore_index=True)               # rows from before the crash, as saved
+        self.Log(f"\nDataframe for {self.name}: \n{df}\n")                      # printing dataframe
+        return df
+
+    # Post processing of a finished test, saved to its store with the sweep and instrument settings as metadata
+    def Pipeline(self,df):
+        return Pipeline(self.name,df,self.store,self.manifest)
+
+    # Where an interrupted sweep continues: (outer index, rows of that step on disk, rows on disk)
+    def Start(self,per_step,tol):
+        if self.resume is None:
+            return 0, 0, 0
+        self.resume_df = pd.read_csv(self.save,index_col=0)                     # data on disk is never rewritten, only appended to
+        written = len(self.resume_df)
+        if tol is None:
+            start, done = divmod(written,per_step)                              # fixed grid: every step is the outer row + every inner point
+        else:
+            start, done = self.resume['done'] + (written > self.resume['rows']), 0 # adaptive: curves are written whole, restart the unfinished one
+        return start, done, written
+
+    # Updates the checkpoint next to the csv, written to a temporary file first so a crash never leaves half a manifest
+    def Checkpoint(self,**changes):
+        self.manifest.update(changes,updated=datetime.utcnow().strftime('%m-%d-%Y @ %H:%M:%S.%f')[:-3])
+        with open(self.checkpoint+'.tmp','w') as f:
+            json.dump(self.manifest,f,indent=1,default=Plain)                   # numpy arguments e.g. from np.arange saved as numbers
+        os.replace(self.checkpoint+'.tmp',self.checkpoint)
+        return
 
-        print(f"\nDataframe for {self.name}: \n{df}\n")                         # printing dataframe
-        df.to_csv(self.save,index=True, float_format='%.15f')                   # save data to csv
-        Format(self.save).RemoveNAN()                                           # Removes NaN's from csv
-        Graph(self.save).Loops()                                                # Graphs Loop performed
+    # Records how a sweep was called so Resume() can call it again
+    def Define(self,method,args):
+        self.method = method
+        self.args = {key: value for key,value in args.items() if key not in ('self','policy')} # policy is saved by its parameters
         return
 
-    def BloopA(self,smub_in1,smub_in2,smub_incr,smua_in1,smua_in2,smua_incr,delay=0,smua_in_type='v',smub_in_type='v',smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)'):
-        self.smua_in_name = smua_in_name
-        self.smub_in_name = smub_in_name
+    # Continues an interrupted AloopB/BloopA from its checkpoint: outputs back to the bias of the next point, new rows appended to the csv
+    def Resume(self):
+        with open(self.checkpoint) as f:
+            self.resume = json.load(f)                                          # sweep definition, progress and settings
+        self.manifest = self.resume
+        self.store = Savepath(self.name,self.resume.get('store','.csv'))        # finished sheet goes where the first run would have put it
+        if self.resume['complete']:
+            self.Log(f"{self.name} is already complete")
+            return
+        if self.resume['settings']['nplc'] is not None:
+            Settings(self.resume['settings']['nplc'],self.smu)                  # same integration time as before the crash
+        policy = Policy(**self.resume['policy']) if self.resume['policy'] is not None else None
+        return getattr(self,self.resume['method'])(**self.resume['args'],policy=policy)
+
+    # Pulsed AloopB: smua steps, smub pulses through its sweep, both pulse together and return to base between pulses
+    def PulsedAloopB(self,smua_in1,smua_in2,smua_incr,smub_in1,smub_in2,smub_incr,width=500e-6,duty=0.01,nplc=0.01,mdelay=None,limita=0.01,limitb=1,rangei=1,base=(0,0),line=60,smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)'):
         self.meas_name = meas_name
+        outer, inner = Train(Grid(smua_in1,smua_in2,smua_incr),Grid(smub_in1,smub_in2,smub_incr)) # every pulse of the grid
+        df = self.Pulse('smua',outer,smua_in_name,'smub',inner,smub_in_name,width,duty,nplc,mdelay,limita,limitb,rangei,base,line)
+        return self.Pipeline(df).RemoveNAN().Plot(*self.Plots('Loops')).Run()    # saves csv once and graphs Loop performed
 
-        # varying smu commands based on v or i supplied
-        apply_smu = 0                                                           # temporary variable to apply voltage/current to smu
-        if smua_in_type == 'v': 
-            def smua_apply():                                                   # Function for applying voltage to smua
-                return SMU.apply_voltage(SMU.smua, apply_smu)                       
-        elif smua_in_type == 'i':   
-            def smua_apply():                                                   # Function for applying current to smua
-                return SMU.apply_current(SMU.smua, apply_smu)                       
-        else:   
-            raise Exception('smua_in_type must be \'v\' or \'i\'')  
-
-        if smub_in_type == 'v': 
-            def smub_apply():                                                   # Function for applying voltage to smub
-                return SMU.apply_voltage(SMU.smub, apply_smu)                        
-            def smub_meas():                                                    # Function for measuring current at smub
-                return SMU.smub.measure.i() 
-            SMU.display.smub.measure.func = SMU.smub.measure.i()                # displaying measured value to smub
-        elif smub_in_type == 'i':   
-            def smub_apply():                                                   # Function for applying current to smub
-                return SMU.apply_current(SMU.smub, apply_smu)                       
-            def smub_meas():                                                    # Function for measuring voltage at smub
-                return SMU.smub.measure.v() 
-            SMU.display.smub.measure.func = SMU.smub.measure.v()                # displaying measured value to smub 
-        else:   
-            raise Exception('smub_in_type must be \'v\' or \'i\'')
+    # Pulsed BloopA: smub steps, smua pulses through its sweep (pulsed transfer curves)
+    def PulsedBloopA(self,smub_in1,smub_in2,smub_incr,smua_in1,smua_in2,smua_incr,width=500e-6,duty=0.01,nplc=0.01,mdelay=None,limita=0.01,limitb=1,rangei=1,base=(0,0),line=60,smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)'):
+        self.meas_name = meas_name
+        outer, inner = Train(Grid(smub_in1,smub_in2,smub_incr),Grid(smua_in1,smua_in2,smua_incr)) # every pulse of the grid
+        df = self.Pulse('smub',outer,smub_in_name,'smua',inner,smua_in_name,width,duty,nplc,mdelay,limita,limitb,rangei,base,line)
+        return self.Pipeline(df).RemoveNAN().AddTransconductance().Plot(*self.Plots('Loop_and_Transconductance')).Run() # adds transconductance, saves csv once and graphs
+
+    # Every point of the level lists as one pulse train run by the 2634B trigger model, read back from the buffer at the end
+    # width: pulse width (s), duty: width/period, nplc: aperture of the reading taken mdelay after the pulse starts (default: end of the pulse)
+    # rangei: fixed current range of smub (no autorange while pulsing), base: (smua, smub) voltages between pulses
+    # hold: levels held until the next point instead of pulsed (a DC list sweep, point every width)
+    def Pulse(self,outer,outer_levels,outer_name,inner,inner_levels,inner_name,width=500e-6,duty=0.01,nplc=0.01,mdelay=None,limita=0.01,limitb=1,rangei=1,base=(0,0),line=60,hold=False):
+        if not 0 < duty <= 1:
+            raise Exception('duty must be between 0 and 1')
+        period = width/duty                                                     # time from one pulse to the next
+        aperture = nplc/line                                                    # time the reading integrates
+        if mdelay is None:
+            mdelay = width-aperture-20e-6                                       # reading at the end of the pulse, once the device settled
+        if mdelay < 0 or mdelay+aperture > width:
+            raise Exception(f'reading ({aperture*1e6:.0f} us) does not fit in the {width*1e6:.0f} us pulse: lower nplc or widen the pulse')
+
+        n = len(inner_levels)
+        levels = {outer: np.asarray(outer_levels,dtype=float), inner: np.asarray(inner_levels,dtype=float)} # levels of both smus, point by point
+        idle = 'SOURCE_HOLD' if hold else 'SOURCE_IDLE'
+        limits = {'smua': limita, 'smub': limitb}
+        bases = {'smua': base[0], 'smub': base[1]}
+        self.progress = Progress(n,self.interval,self.verbose,name=self.name)
+
+        #### Trigger model setup (TSP) #####
+        tsp = []
+        for smu in ('smua','smub'):
+            tsp += [f"pulse_{smu} = {{}}"]                                      # pulse levels sent in chunks, a long list does not fit one line
+            for chunk in range(0,n,200):
+                tsp += [f"for _,v in ipairs({{{','.join(f'{v:.6g}' for v in levels[smu][chunk:chunk+200])}}}) do table.insert(pulse_{smu},v) end"]
+            tsp += [f"{smu}.source.func = {smu}.OUTPUT_DCVOLTS",
+                    f"{smu}.source.autorangev = {smu}.AUTORANGE_OFF",
+                    f"{smu}.source.rangev = {max(np.abs(levels[smu]).max(),abs(bases[smu]))}", # one source range for every pulse
+                    f"{smu}.source.levelv = {bases[smu]}",                      # level between pulses (endpulse SOURCE_IDLE)
+                    f"{smu}.source.limiti = {limits[smu]}",
+                    f"{smu}.trigger.source.limiti = {limits[smu]}",
+                    f"{smu}.trigger.source.listv(pulse_{smu})",
+                    f"{smu}.trigger.source.action = {smu}.ENABLE",
+                    f"{smu}.trigger.endpulse.action = {smu}.{idle}",            # back to base after every pulse (or hold)
+                    f"{smu}.trigger.endsweep.action = {smu}.SOURCE_IDLE",
+                    f"{smu}.trigger.count = {n}",
+                    f"{smu}.trigger.arm.count = 1",
+                    f"{smu}.trigger.source.stimulus = trigger.timer[1].EVENT_ID", # both smus pulse on the same timer
+                    f"{smu}.trigger.endpulse.stimulus = trigger.timer[2].EVENT_ID",
+                    f"{smu}.trigger.measure.action = {smu}.{'ENABLE' if smu == 'smub' else 'DISABLE'}"] # drain current read on smub only
+        tsp += ["smub.measure.autorangei = smub.AUTORANGE_OFF",
+                f"smub.measure.rangei = {rangei}",
+                f"smub.measure.nplc = {nplc}",
+                "smub.measure.delay = 0",
+                "smub.measure.autozero = smub.AUTOZERO_ONCE",                   # no autozero reading between pulses
+                "smub.nvbuffer1.clear()",
+                "smub.trigger.measure.i(smub.nvbuffer1)",
+                "smub.trigger.measure.stimulus = trigger.timer[3].EVENT_ID",
+                # timer 1: period, first pulse when smua is armed
+                "trigger.timer[1].reset()", f"trigger.timer[1].delay = {period}", f"trigger.timer[1].count = {max(n-1,1)}",
+                "trigger.timer[1].passthrough = true", "trigger.timer[1].stimulus = smua.trigger.ARMED_EVENT_ID",
+                # timer 2: pulse width, from the start of each pulse
+                "trigger.timer[2].reset()", f"trigger.timer[2].delay = {width}", "trigger.timer[2].count = 1",
+                "trigger.timer[2].passthrough = false", "trigger.timer[2].stimulus = smua.trigger.SOURCE_COMPLETE_EVENT_ID",
+                # timer 3: reading delay inside the pulse
+                "trigger.timer[3].reset()", f"trigger.timer[3].delay = {mdelay}", "trigger.timer[3].count = 1",
+                "trigger.timer[3].passthrough = false", "trigger.timer[3].stimulus = smua.trigger.SOURCE_COMPLETE_EVENT_ID",
+                "smua.source.output = smua.OUTPUT_ON", "smub.source.output = smub.OUTPUT_ON"]
+        for command in tsp:
+            self.smu._write(command)
+        self.progress.Lap('setup')
+
+        self.manifest.update(pulse={'levels': n, 'width': width, 'duty': duty, 'nplc': nplc, 'mdelay': mdelay, 'limita': limita, 'limitb': limitb,
+                                    'rangei': rangei, 'base': list(base), 'line': line, 'hold': hold},
+                             settings={'ip': getattr(self.smu,'visa_address',ip)}) # saved with the sheet
+
+        #### Pulse train, run by the instrument #####
+        self.Log(f"{n} {'points' if hold else 'pulses'} of {width*1e6:.0f} us every {period*1e3:.2f} ms ({n*period:.1f} s)")
+        timeout = self.smu.connection.timeout
+        self.smu.connection.timeout = 1000*(n*period+10)                        # ms, query below returns when the train is done
+        try:
+            self.smu._write("smub.trigger.initiate()")                          # smub waits for the timers
+            self.smu._write("smua.trigger.initiate()")                          # smua armed: timer 1 starts the train
+            self.smu.connection.query("waitcomplete() print(1)")
+        finally:
+            self.smu.connection.timeout = timeout
+            self.smu._write("smua.source.output = smua.OUTPUT_OFF")             # turn off SMUA
+            self.smu._write("smub.source.output = smub.OUTPUT_OFF")             # turn off SMUB
+        self.progress.Lap('pulses')
+
+        #### Buffered readings, a few thousand per query #####
+        readings = []
+        for chunk in range(1,n+1,2000):
+            reply = self.smu.connection.query(f"printbuffer({chunk},{min(chunk+1999,n)},smub.nvbuffer1.readings)")
+            readings += [float(value) for value in reply.split(',')]
+        self.progress.Lap('read')
+        self.progress.Step(n)
+        self.progress.Finish()
+
+        df = pd.DataFrame({outer_name: levels[outer], inner_name: levels[inner], self.meas_name: readings})
+        df.loc[np.abs(df[self.meas_name]) > 9e37, self.meas_name] = np.nan      # over range readings, dropped by RemoveNAN
+        self.Log(f"\nDataframe for {self.name}: \n{df}\n")                      # printing dataframe
+        return df
+
+    # Hysteresis AloopB: smub sweeps up and back down at every smua step, both directions in one instrument list and one csv
+    # step: time per point (s), the reading is taken at the end of it
+    def HysteresisAloopB(self,smua_in1,smua_in2,smua_incr,smub_in1,smub_in2,smub_incr,step=20e-3,nplc=0.1,mdelay=None,limita=0.01,limitb=1,rangei=1,line=60,icc=1e-7,smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)'):
+        self.meas_name = meas_name
+        outer, inner, direction = Train(Grid(smua_in1,smua_in2,smua_incr),Grid(smub_in1,smub_in2,smub_incr),loop=True)
+        df = self.Pulse('smua',outer,smua_in_name,'smub',inner,smub_in_name,step,1,nplc,mdelay,limita,limitb,rangei,(0,0),line,hold=True)
+        df['Direction'] = direction                                             # 'up' or 'down' for every reading
+        return self.Pipeline(df).RemoveNAN().Hysteresis(icc=icc).Plot(*self.Plots('Loops')).Run() # loop width per curve, saves csv once and graphs
 
-        # fixes divide by 0 error
-        if smua_incr == 0:
-            iter_a = 1                                                                  # only run for loop once
-            for_inner_arr = smua_in1                                                    # only one element in array
-        else:   
-            iter_a = len(np.arange(smua_in1,float(smua_in2+smua_incr),smua_incr))       # how many times to run for loop
-            for_inner_arr = np.arange(smua_in1,float(smua_in2+smua_incr),smua_incr)     # value of elements in array 
-        if smub_incr == 0:  
-            iter_b = 1                                                                  # only run for loop once
-            for_outer_arr = smub_in1                                                    # only one element in array
-        else:       
-            iter_b = len(np.arange(smub_in1,float(smub_in2+smub_incr),smub_incr))       # how many times to run for loop
-            for_outer_arr = np.arange(smub_in1,float(smub_in2+smub_incr),smub_incr)     # value of elements in array
-    
-        # initializes   
-        df = pd.DataFrame()                                                             # initialize empty dataframe
-        total = (iter_a*iter_b)+iter_b                                                  # for counter
-        count = 0                                                                       # counter variable
-    
-        time_start = datetime.utcnow().strftime('%m-%d-%Y @ %H:%M:%S.%f')[:-3]  # start test time
-        print(f"\nStarting time: {time_start}\n")
-
-        SMU.smua.source.output = SMU.smua.OUTPUT_ON                             # turn on SMUA
-        SMU.smub.source.output = SMU.smub.OUTPUT_ON                             # turn on SMUB
-
-        for b in range(0,iter_b):                                               # loop of smub
-            print(f"{count+1} out of {total}")                                  # display iteration counter
-            count = count + 1                                                   # increment counter
-
-            apply_smu = for_outer_arr[b]                                        # set variable to apply voltage/current to smu
-            smub_apply()                                                        # call function to apply voltage/current to smu
-            time.sleep(delay)                                                   # delay for loop
-
-            df = df.append({f"{self.smub_in_name}": for_outer_arr[b]}, ignore_index=True) # add applied value to labeled column in dataframe
-            df.to_csv(savefile+self.name+'.csv', float_format='%.15f')          # save data to csv
-
-            for a in range(iter_a):                                             # loop of smua
-                print(f"{count+1} out of {total}")                              # iteration counter
-                count = count + 1                                               # increment counter
-
-                apply_smu = for_inner_arr[a]                                    # set variable to apply voltage/current to smu
-                smua_apply()                                                    # call function to apply voltage/current to smu
-                time.sleep(delay)                                               # delay for loop
-                meas = smub_meas()                                              # measure value
-
-                df = df.append({f"{self.smua_in_name}": for_inner_arr[a], f"{self.meas_name}": meas}, ignore_index=True) # add applied and measured values to labeled columns in dataframe
-                df.to_csv(self.save, float_format='%.15f')                      # save dataframe to csv
-
-            time_end = datetime.utcnow().strftime('%H:%M:%S.%f')[:-3]           # end test time
-            print(f"\nEnding time: {time_end}\n")
-
-        SMU.smua.source.output = SMU.smua.OUTPUT_OFF                            # turn off SMUA
-        SMU.smub.source.output = SMU.smub.OUTPUT_OFF                            # turn off SMUB
-
-        print(f"\nDataframe for {self.name}: \n{df}\n")                         # printing dataframe results
-        df.to_csv(self.save,index=True, float_format='%.15f')                   # save data to csv
-        Format(self.save).RemoveNAN()                                           # Removes NaN's from csv
-        Format(self.save).AddTransconductance()                                 # Adds transconductance to csv
-        Graph(self.save).Loop_and_Transconductance()                            # Graphs Loop performed and transconuctance
-        return
+    # Hysteresis BloopA: smua sweeps up and back down at every smub step (transfer curve hysteresis)
+    def HysteresisBloopA(self,smub_in1,smub_in2,smub_incr,smua_in1,smua_in2,smua_incr,step=20e-3,nplc=0.1,mdelay=None,limita=0.01,limitb=1,rangei=1,line=60,icc=1e-7,smua_in_name='Vgs (V)',smub_in_name='Vds (V)',meas_name='Ids (A)'):
+        self.meas_name = meas_name
+        outer, inner, direction = Train(Grid(smub_in1,smub_in2,smub_incr),Grid(smua_in1,smua_in2,smua_incr),loop=True)
+        df = self.Pulse('smub',outer,smub_in_name,'smua',inner,smua_in_name,step,1,nplc,mdelay,limita,limitb,rangei,(0,0),line,hold=True)
+        df['Direction'] = direction
+        return self.Pipeline(df).RemoveNAN().AddTransconductance().Hysteresis(icc=icc).Plot(*self.Plots('Loop_and_Transconductance')).Run() # gm per direction and loop width per curve
 
     def TimeTest(self,smua_in,smub_in,time_total,time_step=0,smua_in_type='v',smub_in_type='v',smua_in_name='Vgs (V)',smub_in_name='Vds (V)',xaxis_name='Time (Sec)',meas_name='Ids (A)'):
         self.smua_in_name = smua_in_name
@@ -244,32 +550,32 @@ class Test:
         apply_smu = 0                                                           # initializing variable to apply value to smu
         if smua_in_type == 'v':
             def smua_apply():                                                   # Function for applying voltage to smua
-                return SMU.apply_voltage(SMU.smua, apply_smu)                   
+                return self.smu.apply_voltage(self.smu.smua, apply_smu)         
         elif smua_in_type == 'i':   
             def smua_apply():                                                   # Function for applying current to smua
-                return SMU.apply_current(SMU.smua, apply_smu)                   
+                return self.smu.apply_current(self.smu.smua, apply_smu)         
         else:
             raise Exception('smua_in_type must be \'v\' or \'i\'')
 
         if smub_in_type == 'v':
             def smub_apply():                                                   # Function for applying voltage to smub
-                return SMU.apply_voltage(SMU.smub, apply_smu)                   
+                return self.smu.apply_voltage(self.smu.smub, apply_smu)         
             def smub_meas():
-                return SMU.smub.measure.i()                                     # Function for measuring current at smub
-            SMU.display.smub.measure.func = SMU.smub.measure.i()                # Displaying measurements to smub
+                return self.smu.smub.measure.i()                                # Function for measuring current at smub
+            self.smu.display.smub.measure.func = self.smu.smub.measure.i()      # Displaying measurements to smub
         elif smub_in_type == 'i':
             def smub_apply():                                                   # Function for applying current to smub
-                return SMU.apply_current(SMU.smub, apply_smu)                   
+                return self.smu.apply_current(self.smu.smub, apply_smu)         
             def smub_meas():                                                    # Function for measuring voltage at smub
-                return SMU.smub.measure.v()
-            SMU.display.smub.measure.func = SMU.smub.measure.v()                # Displaying measurements to smub
+                return self.smu.smub.measure.v()
+            self.smu.display.smub.measure.func = self.smu.smub.measure.v()      # Displaying measurements to smub
         else:
             raise Exception('smub_in_type must be \'v\' or \'i\'')
 
         time_start = datetime.utcnow().strftime('%m-%d-%Y @ %H:%M:%S.%f')[:-3]  # start time of test
 
-        SMU.smua.source.output = SMU.smua.OUTPUT_ON                             # turn on SMUA
-        SMU.smub.source.output = SMU.smub.OUTPUT_ON                             # turn on SMUB
+        self.smu.smua.source.output = self.smu.smua.OUTPUT_ON                   # turn on SMUA
+        self.smu.smub.source.output = self.smu.smub.OUTPUT_ON                   # turn on SMUB
 
         apply_smu = smua_in                                                     # setting variable to apply to smua
         smua_apply()                                                            # applying voltage/current to smua
@@ -277,179 +583,469 @@ class Test:
         smub_apply()                                                            # applying voltage/current to smub
 
         # initializing dataframe
-        df = pd.DataFrame()                                                                                     # initializing empty dataframe for storing data
-        df = df.append({f"{self.smua_in_name}": smua_in, f"{self.smub_in_name}": smub_in}, ignore_index=True)   # adding applied voltage/current at smua & smub to labeled columns in dataframe
-
+        columns = [self.smua_in_name,self.smub_in_name,self.meas_name,'Time (s)']                              # fixed csv columns, rows are only appended
+        rows = [{f"{self.smua_in_name}": smua_in, f"{self.smub_in_name}": smub_in}]                             # adding applied voltage/current at smua & smub to labeled columns
+        pd.DataFrame(rows,columns=columns).to_csv(self.save)                                                    # header and applied values
+
+        points = len(np.arange(0,time_total+time_step))                                                         # determining how many times to run for loop
+        self.manifest.update(settings={'ip': getattr(self.smu,'visa_address',ip), 'nplc': integration, 'time_step': time_step, 'time_total': time_total}) # saved with the sheet
+        progress = self.progress = Progress(points,self.interval,self.verbose,name=self.name)                   # throttled counter, rate, ETA and phase times
+        t = Timer(verbose=False)                                                                                # own timer, tests may run at the same time, no print per point
         t.start()                                                                                               # starting elapse time timer
-        for n in len(np.arange(0,time_total+time_step)):                                                        # determining how many times to run for loop
-            print(f"{n+1} out of {len(np.arange(0,time_total+time_step))}")                                     # iteration counter for ease of use
-
+        for n in range(points):
+            progress.Lap('other')
             meas = smub_meas()                                                                                  # measuring voltage/current at smub
+            progress.Lap('measure')
             elapsed_time = t.stop()                                                                             # calculating elapsed time from last t.start()
             t.start()                                                                                           # restarting elapse time timer
 
-            df = df.append({f"{self.meas_name}": meas,'Time (s)': elapsed_time}, ignore_index=True)             # add measured value to labeled column in dataframe
-            df.to_csv(self.save)                                                                                # save dataframe to csv
+            rows.append({f"{self.meas_name}": meas,'Time (s)': elapsed_time})                                   # add measured value to labeled column
+            pd.DataFrame(rows[-1:],columns=columns,index=[n+1]).to_csv(self.save,mode='a',header=False)         # append row to csv
+            progress.Lap('record')
             time.sleep(time_step)                                                                               # delay for between for loops 
+            progress.Lap('settle')
+            progress.Step()                                                                                     # iteration counter, printed at most every interval
         t.stop()                                                                                                # stopping elapse time timer
+        progress.Finish()
+        df = pd.DataFrame(rows,columns=columns)
 
-        SMU.smua.source.output = SMU.smua.OUTPUT_OFF                            # turn off SMUA
-        SMU.smub.source.output = SMU.smub.OUTPUT_OFF                            # turn off SMUB
+        self.smu.smua.source.output = self.smu.smua.OUTPUT_OFF                  # turn off SMUA
+        self.smu.smub.source.output = self.smu.smub.OUTPUT_OFF                  # turn off SMUB
 
         time_end = datetime.utcnow().strftime('%H:%M:%S.%f')[:-3]
-        print(f"\nStarting time: {time_start}")
-        print(f"\nEnding time: {time_end}\n")
+        self.Log(f"\nStarting time: {time_start}")
+        self.Log(f"\nEnding time: {time_end}\n")
+
+        self.Log(f"\nDataframe for {self.name}: \n{df}\n")                      # printing dataframe results
+        return self.Pipeline(df).RemoveNAN().Plot(*self.Plots('TimeTest')).Run() # Removes NaN's, saves csv once and graphs
+
+# Several benches at once: every instrument gets its own session and thread, its tests run in order on it
+# A failing instrument or test is recorded and the others carry on; graphs are drawn after every thread is done
+class Lot:
+    def __init__(self,plot=True,interval=10,store='csv'):
+        self.benches = {}                                                       # ip -> tests to run on that instrument
+        self.store = store                                                      # File every sheet of the lot is saved as, see Test
+        self.plot = plot                                                        # Draw the graphs of every test after the run
+        self.interval = interval                                                # Seconds between progress lines
+        self.tests = {}                                                         # name -> Test, for progress and graphs
+        self.results = []                                                       # One row per test: bench, status, time, error
+        self.data = {}                                                          # name -> dataframe of every finished test
+        self.lock = threading.Lock()                                            # Results are added from the bench threads
+        return
+
+    def Add(self,ip,name,method,*args,**kwargs):
+        self.benches.setdefault(ip,[]).append((name,method,args,kwargs))        # e.g. Add(ip,'dev1_BloopA','BloopA',0,1.2,0.4,0.5,2,0.1)
+        return self
+
+    def Run(self):
+        if not self.benches:
+            print("Lot has no tests, Add() them first")
+            return pd.DataFrame(columns=['ip','name','method','status','seconds','error']) # Same table as a run, without rows
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.benches)) as pool:
+            futures = [pool.submit(self.Bench,ip,tests) for ip,tests in self.benches.items()]
+            while concurrent.futures.wait(futures,timeout=self.interval).not_done:
+                self.Status()                                                   # Combined progress of every bench
+        self.Status()
+        print(f"Lot finished in {time.perf_counter()-start:0.1f} seconds")
+
+        if self.plot:
+            for name,test in self.tests.items():
+                if name in self.data:
+                    for plot in test.plots:
+                        plt.close(getattr(Graph(name,self.data[name]),plot)())  # Graphs in the main thread, matplotlib is not thread safe
+        return pd.DataFrame(self.results)
+
+    # Thread of one instrument: connect, run its tests one after another, disconnect
+    def Bench(self,ip,tests):
+        try:
+            smu = Connect(ip)                                                   # Own session per instrument
+        except Exception as error:
+            for name,method,args,kwargs in tests:
+                self.Result(ip,name,method,'no connection',0,error)
+            return
+        try:
+            for name,method,args,kwargs in tests:
+                test = Test(name,smu=smu,plot=False,verbose=False,store=self.store)
+                with self.lock:
+                    self.tests[name] = test
+                start = time.perf_counter()
+                try:
+                    df = getattr(test,method)(*args,**kwargs)
+                except Exception as error:
+                    test.progress.end = test.progress.end or time.perf_counter()  # Freezes its elapsed time and rate where it failed
+                    self.Result(ip,name,method,'failed',time.perf_counter()-start,error)
+                    try:
+                        smu.smua.source.output = smu.smua.OUTPUT_OFF            # Leave the device unbiased
+                        smu.smub.source.output = smu.smub.OUTPUT_OFF
+                    except Exception:
+                        break                                                   # Instrument gone, skip the rest of its tests
+                    continue
+                with self.lock:
+                    self.data[name] = df
+                self.Result(ip,name,method,'done',time.perf_counter()-start)
+        finally:
+            try:
+                smu.disconnect()
+            except Exception:
+                pass
+        for name,method,args,kwargs in tests:
+            if name not in self.tests:
+                self.Result(ip,name,method,'skipped',0)                         # Not run because the instrument stopped answering
+        return
+
+    def Result(self,ip,name,method,status,seconds,error=None):
+        with self.lock:
+            self.results.append({'ip': ip, 'name': name, 'method': method, 'status': status,
+                                 'seconds': round(seconds,3), 'error': None if error is None else repr(error)})
+        return
 
-        print(f"\nDataframe for {self.name}: \n{df}\n")                         # printing dataframe results
-        df.to_csv(self.save, float_format='%.15f')                              # save dataframe to csv
-        Format(self.save).RemoveNAN()                                           # Removes NaN's from csv
-        Graph(self.save).Timetest()                                             # graph csv file
+    # Progress of every test so far, one row per test (count, rate, ETA, phase times)
+    def Progress(self):
+        with self.lock:
+            tests = list(self.tests.values())
+        return pd.DataFrame([test.progress.Snapshot() for test in tests])
+
+    def Status(self):
+        with self.lock:
+            failed = sum(result['status'] != 'done' for result in self.results)
+            finished = len(self.results)
+            ended = {result['name'] for result in self.results}                 # Done or failed: no longer adds to the rate or ETA
+        progress = self.Progress()
+        if len(progress):
+            running = progress[~progress['name'].isin(ended)]
+            print(f"{finished} of {sum(map(len,self.benches.values()))} tests finished ({failed} failed), {progress['count'].sum()} points, "
+                  f"{running['rate (pts/s)'].sum():.1f} pts/s, ETA {running['eta (s)'].max() if len(running) else 0:.0f} s")
         return
 
+# Point by point levels of the outer and inner smu for a whole grid: outer held for every inner sweep
+# loop: every inner sweep goes up and back down, also returns the direction of every point
+def Train(outer_arr,inner_arr,loop=False):
+    if loop:
+        inner_arr = np.concatenate((inner_arr,inner_arr[::-1]))                # up then the same points down
+    outer = np.repeat(outer_arr,len(inner_arr))
+    inner = np.tile(inner_arr,len(outer_arr))
+    if not loop:
+        return outer, inner
+    direction = np.tile(np.repeat(['up','down'],len(inner_arr)//2),len(outer_arr))
+    return outer, inner, direction
+
+# Values of one sweep, a single value if the increment is 0 (fixes divide by 0 error caused by np.arange())
+def Grid(start,stop,incr):
+    if incr == 0:
+        return np.array([start])                                                # only run loop once
+    return np.arange(start,float(stop+incr),incr)                               # creates array for the sweep values
+
+# File a sheet can be stored as: csv text, or columnar parquet/feather (needs pyarrow) with typed columns and the test's metadata in the footer
+Stores = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Path of a test's sheet: names are prefixed with savefile, full paths ('.csv', '.parquet', '.feather') are used as given
+def Savepath(name,ext='.csv'):
+    if name.endswith(tuple(Stores.values())):                                   # Already a path, don't append twice
+        return name
+    return savefile+name+ext
+
+# Path of a sheet on disk whatever it is stored as (newest if there are several), csv path if there is none yet
+def Find(name):
+    paths = [path for path in {Savepath(name,ext) for ext in Stores.values()} if os.path.exists(path)]
+    return max(paths,key=os.path.getmtime) if paths else Savepath(name)
+
+# Read-only sheet for graphing, parsed once per session until the file changes on disk
+# columns: only read these columns (parquet/feather skip the others on disk)
+def Load(name,columns=None):
+    path = os.path.abspath(Find(name))
+    stat = os.stat(path)
+    return Read(path,stat.st_mtime_ns,stat.st_size,tuple(columns) if columns is not None else None) # New mtime or size means a new cache entry
+
+@functools.lru_cache(maxsize=128)
+def Read(path,mtime,size,columns=None):
+    return Open(path,columns)
+
+# Reads a sheet of any store, metadata saved with it (sweep, settings, policy) is put in df.attrs['smu']
+def Open(path,columns=None):
+    ext = os.path.splitext(path)[1]
+    if ext == '.csv':
+        if columns is None:
+            return pd.read_csv(path,index_col=0)                                # Read csv file, removes index column
+        df = pd.read_csv(path,index_col=0,usecols=lambda col: col in columns or col.startswith('Unnamed: ')) # Index column and the wanted ones
+        return df[list(columns)]
+    read, write = Arrow(ext)
+    table = read(path,columns=list(columns) if columns is not None else None)  # Columnar: only the wanted columns are read
+    df = table.to_pandas()
+    meta = (table.schema.metadata or {}).get(b'smu')
+    if meta is not None:
+        df.attrs['smu'] = json.loads(meta)
+    return df
+
+# Writes a sheet as its extension says, meta goes in the parquet/feather footer (the csv has its .json checkpoint)
+def Store(df,path,meta=None):
+    ext = os.path.splitext(path)[1]
+    if ext == '.csv':
+        df.to_csv(path,index=True,float_format="%.15f")                         # Write dataframe to csv
+        return
+    import pyarrow as pa                                                        # only needed for columnar sheets
+    table = pa.Table.from_pandas(df)
+    if meta:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'smu': json.dumps(meta,default=str).encode()})
+    read, write = Arrow(ext)
+    write(table,path+'.tmp')                                                    # whole file first, graphs may be reading the old one
+    os.replace(path+'.tmp',path)
+    return
+
+# Read and write functions of pyarrow for a columnar extension
+def Arrow(ext):
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table, pq.write_table
+    import pyarrow.feather as feather
+    return feather.read_table, feather.write_feather
+
 class Format:
-    def __init__(self,name):
+    def __init__(self,name,df=None,save=None,meta=None):
         self.name = name                                                        # Input sheet to modify
-        self.save = savefile+self.name+'.csv'                                   # Path and name of csv file to call in one: self.save
-        self.df = pd.read_csv(self.save,index_col=0)                            # Read csv file, removes index column
+        self.save = Find(self.name) if save is None else save                   # Path of the sheet (csv, parquet or feather) to call in one: self.save
+        self.autosave = df is None                                              # Sheets read from disk are rewritten after every step
+        if df is None:
+            df = Open(self.save)                                                # Read sheet, removes index column
+        self.df = df
+        self.meta = df.attrs.get('smu') if meta is None else meta               # Sweep and instrument settings, kept in columnar sheets
         self.columns = list(self.df)                                            # Lists inputs then outputs4
 
         return
 
+    def Save(self):
+        Store(self.df,self.save,self.meta)                                      # Write dataframe to csv/parquet/feather
+        journal = Savepath(self.name)
+        if self.save != journal and os.path.exists(journal):
+            os.remove(journal)                                                  # A sheet lives in one file, the csv journal of a columnar test is replaced
+        return
+
+    def Autosave(self):
+        if self.autosave:                                                       # In memory sheets are saved once by Pipeline
+            self.Save()
+        return
+
     def RemoveNAN(self):
         subset_cols = [self.columns[0], self.columns[1]]                            # Specify Columns to modify in next line
-        [self.df[col].fillna(method="ffill", inplace=True) for col in subset_cols]  # Fill NaN by using pervious entry(ffill) in first 2 columns, modify current dataframe rather than create a new one(inplace)
+        self.df[subset_cols] = self.df[subset_cols].ffill()                         # Fill NaN by using pervious entry(ffill) in first 2 columns
         self.df.dropna(inplace=True)                                                # Remove rows that contain at least one NaN's
         self.df.reset_index(drop=True,inplace=True)                                 # Reset index after dropping rows, drop=true to avoid old index being inserted
-        self.df.to_csv(self.save,index=True,float_format="%.15f")                   # Write dataframe to csv
+        self.Autosave()                                                             # Write dataframe to csv
+        return
+
+    def AddTransconductance(self,window=5):
+        vgs = self.Column('Vgs',self.columns[1])                                # Gate column, inner sweep if not named
+        self.Add('gm (S)',self.Derivative(self.columns[2],vgs,window))         # gm = dIds/dVgs along every curve
+        self.Autosave()                                                         # Write dataframe to csv
+        return
+
+    def AddOutputConductance(self,window=5):
+        vds = self.Column('Vds',self.columns[0])                                # Drain column, outer sweep if not named
+        self.Add('gds (S)',self.Derivative(self.columns[2],vds,window))        # gds = dIds/dVds along every curve
+        self.Autosave()                                                         # Write dataframe to csv
+        return
+
+    def AddSecondDerivative(self,x='Vgs',window=5):
+        x = self.Column(x,self.columns[1])                                      # Column to differentiate against
+        symbol = x.split(' ')[0]                                                # 'Vgs (V)' -> 'Vgs'
+        first = {'Vgs':'gm','Vds':'gds'}.get(symbol,'g')                        # Name of the first derivative
+        self.Add(f"d{first}/d{symbol} (S/V)",self.Derivative(self.columns[2],x,window,order=2)) # d2Ids/dx2 along every curve
+        self.Autosave()                                                         # Write dataframe to csv
+        return
+
+    # Parameters of every curve (Vth, gm, SS, Ion/Ioff, DIBL or Ron, gds) in one table, saved as <name>_Summary.csv
+    def Extract(self,**kwargs):
+        df = self.Curves()
+        keys = [self.columns[0]] + (['Direction'] if 'Direction' in df else []) # One curve per step (and sweep direction)
+        if self.columns[1].startswith('Vgs'):                                   # Transfer curves, one per step of the outer sweep
+            self.summary = Analysis.Transfer(df,self.columns[1],self.columns[2],keys,**kwargs)
+        else:                                                                   # Output curves
+            self.summary = Analysis.Output(df,self.columns[1],self.columns[2],keys,**kwargs)
+        self.summary.to_csv(os.path.splitext(self.save)[0]+'_Summary.csv',float_format='%.6g') # Next to the sheet
+        print(f"\nParameters of {self.name}: \n{self.summary}\n")
+        return
+
+    # Width of the up/down loop of every curve (max dI, loop area, shift at icc), saved as <name>_Hysteresis.csv
+    def Hysteresis(self,icc=1e-7):
+        self.hysteresis = Analysis.Hysteresis(self.Curves(),self.columns[1],self.columns[2],[self.columns[0]],icc=icc)
+        self.hysteresis.to_csv(os.path.splitext(self.save)[0]+'_Hysteresis.csv',float_format='%.6g') # Next to the sheet
+        print(f"\nHysteresis of {self.name}: \n{self.hysteresis}\n")
+        if self.hysteresis['Unpaired points'].any():                            # e.g. over range readings removed by RemoveNAN
+            print(f"{self.hysteresis['Unpaired points'].sum()} points of {self.name} were read in one direction only and left out of the loop width")
+        return
+
+    # Sweep columns with the step value on every row, without changing the sheet
+    def Curves(self):
+        df = self.df[self.columns[:3] + [col for col in ['Direction'] if col in self.df]].copy()
+        df[self.columns[0]] = df[self.columns[0]].ffill()
+        return df.dropna()
+
+    def Add(self,name,values):
+        if name not in self.df:
+            at = next((n for n,col in enumerate(self.df) if col in Recorded),len(self.df.columns)) # Before policy settings, so plots keep their column numbers
+            self.df.insert(at,name,values)
+        else:
+            self.df[name] = values
+        self.columns = list(self.df)
         return
 
-    def AddTransconductance(self):
-        def np_slope(data):
-            return np.polyfit(data.index.values,data.values,1)[0]
-        self.df['gm (S)'] = self.df[self.columns[2]].rolling(5,min_periods=2).apply(np_slope,raw=False)        
-        self.df.to_csv(self.save,index=True,float_format="%.15f")                  # Write dataframe to csv
+    def Column(self,prefix,default):
+        return next((col for col in self.columns[:2] if col.startswith(prefix)),default) # First sweep column named like prefix
+
+    def Derivative(self,y,x,window=5,order=1):
+        keys = [self.df[col].values for col in self.columns[:2] if col != x]    # The other sweep column separates the curves
+        if 'Direction' in self.df:
+            keys.append(self.df['Direction'].values)                            # Up and down sweeps are separate curves
+        return Analysis.Derivative(self.df[x].values,self.df[y].values,keys,window,order)
+
+# Post processing straight from the sweep: stages run on the dataframe in memory, csv is written once
+class Pipeline:
+    def __init__(self,name,df=None,save=None,meta=None):
+        self.name = name                                                        # Sheet name, also used for the plots
+        self.format = Format(name,Open(Find(name)) if df is None else df,save,meta) # Old sheets load once as well
+        self.stages = []                                                        # Functions run in order on the dataframe
+        self.plots = []                                                         # Graph methods run after saving
         return
-        
+
+    def Stage(self,function,*args,**kwargs):
+        self.stages.append((function,args,kwargs))                              # Any function of (dataframe, ...) returning a dataframe
+        return self
+
+    def RemoveNAN(self):
+        return self.Stage(Format.RemoveNAN)
+
+    def AddTransconductance(self,window=5):
+        return self.Stage(Format.AddTransconductance,window)
+
+    def AddOutputConductance(self,window=5):
+        return self.Stage(Format.AddOutputConductance,window)
+
+    def AddSecondDerivative(self,x='Vgs',window=5):
+        return self.Stage(Format.AddSecondDerivative,x,window)
+
+    def Extract(self,**kwargs):
+        return self.Stage(Format.Extract,**kwargs)
+
+    def Hysteresis(self,icc=1e-7):
+        return self.Stage(Format.Hysteresis,icc)
+
+    def Plot(self,*plots):
+        self.plots.extend(plots)                                                # Names of Graph methods e.g. 'Loops'
+        return self
+
+    def Run(self):
+        try:
+            for function,args,kwargs in self.stages:
+                if getattr(Format,function.__name__,None) is function:          # Format step works on self.format in place
+                    function(self.format,*args,**kwargs)
+                else:
+                    self.format.df = function(self.format.df,*args,**kwargs)
+                self.format.columns = list(self.format.df)
+        finally:
+            self.format.Save()                                                  # Only write of the sheet: processed, or as far as a failed stage got
+        graph = Graph(self.name,self.format.df)                                 # Graph the dataframe already in memory
+        for plot in self.plots:
+            plt.close(getattr(graph,plot)())                                    # Saved to png, closed so long Lot runs don't pile up figures
+        return self.format.df
+
 class Graph:
-    def __init__(self,name):
+    def __init__(self,name,df=None):
         self.name = name                                                        # Input sheet to graph
-        self.save = savefile+self.name+'.csv'                                   # Path and name of csv file to call in one: self.save
-        self.df = pd.read_csv(self.save,index_col=0)                            # Read csv file, removes index column
+        self.save = Find(self.name)                                             # Path of the sheet (csv, parquet or feather) to call in one: self.save
+        if df is None:
+            df = Load(self.save)                                                # Read sheet (cached), removes index column
+        self.df = df
         self.columns = list(self.df)                                            # Lists inputs then outputs4
 
         ##### Splicing Dataframe #####  
-        df2 = self.df.copy(deep=True)                                           # Copy dataframe, leaving first one untouched
-        df2['step'] = df2[self.columns[0]].diff()                               # Create new column to see when big sweep steps up
-        df2.query('`step` != 0', inplace=True)                                  # Find first rows of each big sweep values
-        orows = self.df.shape[0]                                                # Find how many rows there are in orignial data frame
-        if df2.shape[0] == 1:                                                   # If only sweeping one value
-            self.rows = [0, orows]                                              # Get row value from original data frame and create splice
-        else:   
-            rows = df2.index.array                                              # Create array to represent index values where big sweep chagnes
-            self.rows = np.append(rows,orows)                                   # Add final upper limit of splice
-
-       ##### Setup for Plots #####  
-        plt.clf()                                                               # Clear active plots
-        self.upper = 0                                                          # Variable for determining the upper limit of the splice
-        self.lower = 0                                                          # Variable for determining the lower limit of the splice
+        self.curves = Analysis.Curves(self.df)                                  # Offsets of every big sweep value, built once for all plots
+        self.rows = self.curves.offsets                                         # Splice i is rows[i]:rows[i+1]
         return  
 
+    def Draw(self,ax,x,y,label=None,color=None):
+        lines = self.curves.Lines(self.columns[x],self.columns[y])              # Every splice as an (n,2) array
+        if color is None:
+            cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']           # Same colors plt.plot would pick
+            colors = [cycle[n % len(cycle)] for n in range(len(lines))]
+        else:
+            colors = [color]*len(lines)                                         # Whole sheet in one color (overlays)
+        ax.add_collection(LineCollection(lines,colors=colors))                  # All splices drawn as one artist
+        ax.autoscale_view()                                                     # Collections don't rescale the axes by themselves
+        if label is None:
+            return []
+        if isinstance(label,str):                                               # One legend entry for the whole sheet
+            return [Line2D([],[],color=color,label=label)]
+        return [Line2D([],[],color=c,label=label(key)) for c,(_,key) in zip(colors,self.curves.keys.iterrows())] # One legend entry per splice
+
+    def Legend(self,key):
+        return f"{self.columns[0]}: {key.iloc[0]}"                              # What big sweep equals for a splice
+
     def Loops(self):    
         fig, ax = plt.subplots()                                                # Setup for Plot
 
         #### Plotting ##### 
-        for y in self.rows:                                                     # Loop for amount of big sweep vaules
-            self.upper += 1                                                     # Increase upper limit for next splice
-            if len(self.rows)-1 < self.upper:                                   # Have we reached the final splice?
-                break                                                           # Stop splicing
-            y = self.df.iloc[self.rows[self.lower]:self.rows[self.upper]]       # Splice df into each value of big sweep
-            self.lower += 1                                                     # Increase upper limit for next splice
-            legend = y.iloc[0,0]                                                # Find what big sweep equals to every splice
-            plt.plot(y[self.columns[1]],y[self.columns[2]], '-', label=f"{self.columns[0]}: {legend}") # Plot small sweep(xaxis) & Ids(y-axis)
+        ax.legend(handles=self.Draw(ax,1,2,self.Legend))                        # Plot small sweep(xaxis) & Ids(y-axis) for every big sweep value
 
         ##### Labeling Plot #####   
-        plt.title(f"{self.name}: {self.columns[2]} vs. {self.columns[1]}",fontsize='20') # Title is name of part and test performed
+        ax.set_title(f"{self.name}: {self.columns[2]} vs. {self.columns[1]}",fontsize='20') # Title is name of part and test performed
         Labeloffset(ax, label=self.columns[1], axis="x")                        # Label x axis
         Labeloffset(ax, label=self.columns[2], axis="y")                        # Label y axis
-        plt.legend()                                                            # Legend is different splicings
-        plt.tight_layout()                                                      # Make plot fit inside window
-        plt.savefig(savefile+self.name+'_Loops.png')                            # Saving plot to png file
-        return  
+        fig.tight_layout()                                                      # Make plot fit inside window
+        fig.savefig(savefile+self.name+'_Loops.png')                            # Saving plot to png file
+        return fig
 
     def Transconductance(self): 
         fig, ax = plt.subplots()                                                # Setup for Plot
 
         #### Plotting ##### 
-        for y in self.rows:                                                     # Loop for amount of big sweep vaules
-            self.upper += 1                                                     # Increase upper limit for next splice
-            if len(self.rows)-1 < self.upper:                                   # Have we reached the final splice?
-                break                                                           # Stop splicing
-            y = self.df.iloc[self.rows[self.lower]:self.rows[self.upper]]       # Splice df into each value of big sweep
-            self.lower += 1                                                     # Increase upper limit for next splice
-            legend = y.iloc[0,0]                                                # Find what big sweep equals to every splice
-            plt.plot(y[self.columns[1]],y[self.columns[3]], '-', label=f"{self.columns[0]}: {legend}") # Plot small(x-axis) & Transconductance(y-axis)
+        ax.legend(handles=self.Draw(ax,1,3,self.Legend))                        # Plot small(x-axis) & Transconductance(y-axis) for every big sweep value
 
         ##### Labeling Plot #####   
-        plt.title(f"{self.name}: {self.columns[3]} vs. {self.columns[1]}",fontsize='20') # Title is name of part and test performed
+        ax.set_title(f"{self.name}: {self.columns[3]} vs. {self.columns[1]}",fontsize='20') # Title is name of part and test performed
         Labeloffset(ax, label=self.columns[1], axis="x")                        # Label x axis
         Labeloffset(ax, label=self.columns[3], axis="y")                        # Label y axis
-        plt.legend()                                                            # Legend is different splicings
-        plt.tight_layout()                                                      # Make plot fit inside window
-        plt.savefig(savefile+self.name+'_Transconductance.png')                 # Saving plot to png file
-        return  
+        fig.tight_layout()                                                      # Make plot fit inside window
+        fig.savefig(savefile+self.name+'_Transconductance.png')                 # Saving plot to png file
+        return fig
 
     def Loop_and_Transconductance(self):    
         #### Setup Subplots #####   
         fig = plt.figure()  
         gs = gridspec.GridSpec(2,1)                                             # Set height ratios for subplots
-        ax0 = plt.subplot(gs[0])                                                # The first subplot
-        ax1 = plt.subplot(gs[1], sharex = ax0)                                  # The second subplot
+        ax0 = fig.add_subplot(gs[0])                                            # The first subplot
+        ax1 = fig.add_subplot(gs[1], sharex = ax0)                              # The second subplot
 
        ##### Plotting ##### 
-        for y in self.rows:                                                     # Loop for amount of Vgs vaules
-            self.upper += 1                                                     # Increase upper limit for next splice
-            if len(self.rows)-1 < self.upper:                                   # Have we reached the final splice?
-                break                                                           # Stop splicing
-            y = self.df.iloc[self.rows[self.lower]:self.rows[self.upper]]       # Splice df into each value of Vgs
-            self.lower += 1                                                     # Increase upper limit for next splice
-            legend = y.iloc[0,0]                                                # Find what Vgs equals to every splice
-            ax0.plot(y[self.columns[1]],y[self.columns[2]], '-', label=f"{self.columns[0]}: {legend}") # Plot top graph with legend
-            ax1.plot(y[self.columns[1]],y[self.columns[3]], '-')                # Plot bottom graph
+        ax0.legend(handles=self.Draw(ax0,1,2,self.Legend))                      # Plot top graph with legend
+        self.Draw(ax1,1,3)                                                      # Plot bottom graph
 
         ##### Labeling Plot #####   
-        plt.subplots_adjust(hspace=.0)                                          # Remove vertical gap between subplots
+        fig.subplots_adjust(hspace=.0)                                          # Remove vertical gap between subplots
         fig.suptitle(f"{self.name}: {self.columns[2]} & {self.columns[3]} vs. {self.columns[1]}",fontsize='18') # Title is name of part and test performed
         Labeloffset(ax1, label=self.columns[1], axis="x")                       # Label x axis
         Labeloffset(ax0, label=self.columns[2], axis="y")                       # Label top graph y axis
         Labeloffset(ax1, label=self.columns[3], axis="y")                       # Label bottom graph y axis
-        plt.savefig(savefile+self.name+'Loops+Transconductance.png')            # Saving plot to png file
-        return  
+        fig.savefig(savefile+self.name+'Loops+Transconductance.png')            # Saving plot to png file
+        return fig
 
     def TimeTest(self): 
+        fig, ax = plt.subplots()                                                # Setup for Plot
+
         #### Plotting ##### 
-        for y in self.rows:                                                     # Loop for amount of big sweep vaules
-            self.upper += 1                                                     # Increase upper limit for next splice
-            if len(self.rows)-1 < self.upper:                                   # Have we reached the final splice?
-                break                                                           # Stop splicing
-            y = self.df.iloc[self.rows[self.lower]:self.rows[self.upper]]       # Splice df into each value of big sweep
-            self.lower += 1                                                     # Increase upper limit for next splice
-            legend1 = y.iloc[0,0]                                               # Find what big sweep equals to every splice
-            legend2 = y.iloc[0,1]   
-            plt.plot(y[self.columns[3]],y[self.columns[2]], '-', label=f"{self.columns[0]}: {legend1}\n{self.columns[1]}: {legend2}") # Plot small sweep(xaxis) & Ids(y-axis)
+        ax.legend(handles=self.Draw(ax,3,2,lambda key: f"{self.Legend(key)}\n{self.columns[1]}: {key.iloc[1]}")) # Plot time(xaxis) & Ids(y-axis)
 
         ##### Labeling Plot #####   
-        plt.title(f"{self.name}: {self.columns[2]} vs. {self.columns[3]}",fontsize='20') # Title is name of part and test performed
-        plt.xlabel(self.columns[3])                                             # x axis is time
-        plt.ylabel(self.columns[2])                                             # y axis is measured
-        plt.legend()                                                            # Legend is different splicings
-        plt.tight_layout()                                                      # Make plot fit inside window
-        plt.savefig(savefile+self.name+'_Timetest.png')                         # Saving plot to png file
-        plt.show()                                                              # Make plot visible
-        return  
+        ax.set_title(f"{self.name}: {self.columns[2]} vs. {self.columns[3]}",fontsize='20') # Title is name of part and test performed
+        ax.set_xlabel(self.columns[3])                                          # x axis is time
+        ax.set_ylabel(self.columns[2])                                          # y axis is measured
+        fig.tight_layout()                                                      # Make plot fit inside window
+        fig.savefig(savefile+self.name+'_Timetest.png')                         # Saving plot to png file
+        return fig                                                              # Shown or closed by the caller like every other plot
 
 class Timer:    
-    def __init__(self): 
+    def __init__(self,verbose=True): 
         self._start_time = None 
+        self.verbose = verbose                                                  # False: stop() only returns the time
 
     def start(self):    
         self._start_time = time.perf_counter()  
@@ -458,86 +1054,142 @@ class Timer:
     def stop(self): 
         elapsed_time = time.perf_counter() - self._start_time   
         self._start_time = None 
-        print(f"Elapsed time: {elapsed_time:0.6f} seconds") 
+        if self.verbose:
+            print(f"Elapsed time: {elapsed_time:0.6f} seconds") 
         return elapsed_time 
 t = Timer() 
 
-class Graphs_Overlay:   
+# Progress of a test: printed at most every interval seconds, with points/sec, ETA and where the time goes
+# Lap(phase) adds the time since the previous lap to that phase, Snapshot() gives everything as a dict for logging
+class Progress:
+    def __init__(self,total=0,interval=1,verbose=True,callback=None,count=0,name=''):
+        self.total = total                                                      # Points expected (upper bound for adaptive sweeps)
+        self.interval = interval                                                # Seconds between reports
+        self.verbose = verbose                                                  # Print the reports
+        self.callback = callback                                                # Function given every Snapshot() when reporting
+        self.name = name
+        self.count = count                                                      # Points done, including ones done before a resume
+        self.first = count                                                      # Rate only counts points of this run
+        self.phases = {}                                                        # Seconds spent per phase e.g. source, settle, measure, record
+        self.start = self.lap = self.shown = time.perf_counter()
+        self.end = None                                                         # Set by Finish(): elapsed and rate frozen from then on
+        return
+
+    def Lap(self,phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase,0) + now - self.lap
+        self.lap = now
+        return
+
+    def Step(self,n=1):
+        self.count += n
+        if self.lap - self.shown >= self.interval:                              # Last lap time, no extra clock read per point
+            self.Report()
+        return
+
+    def Snapshot(self):
+        elapsed = (time.perf_counter() if self.end is None else self.end) - self.start
+        rate = (self.count - self.first)/elapsed if elapsed > 0 else 0.0
+        eta = 0.0 if self.end is not None else max(self.total - self.count,0)/rate if rate > 0 else float('nan')
+        return {'name': self.name, 'count': self.count, 'total': self.total, 'elapsed (s)': elapsed,
+                'rate (pts/s)': rate, 'eta (s)': eta, **{f"{phase} (s)": seconds for phase,seconds in self.phases.items()}}
+
+    def Report(self):
+        self.shown = time.perf_counter()
+        snapshot = self.Snapshot()
+        if self.callback is not None:
+            self.callback(snapshot)
+        if self.verbose:
+            busy = sum(self.phases.values()) or 1
+            phases = ', '.join(f"{phase} {100*seconds/busy:.0f}%" for phase,seconds in self.phases.items())
+            print(f"{self.name}: {snapshot['count']} of {snapshot['total']}, {snapshot['rate (pts/s)']:.1f} pts/s, ETA {snapshot['eta (s)']:.0f} s ({phases})")
+        return snapshot
+
+    def Finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+        return self.Report()                                                    # Final numbers whatever the interval
+
+# Any number of sheets (e.g. a whole lot of devices) in one figure, or a grid of small plots
+class Overlay:
+    def __init__(self,*names,title=None):
+        self.names = names                                                      # Input sheets to graph
+        self.graphs = [Graph(name) for name in names]                           # Each csv is parsed once per session (Load cache)
+        if title is None:
+            title = ' & '.join(names) if len(names) <= 2 else f"Overlay of {len(names)}" # Title and png name
+        self.title = title
+        return
+
+    def Colors(self):
+        cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        if len(self.graphs) <= len(cycle):                                      # Few sheets: usual plot colors
+            return cycle[:len(self.graphs)]
+        return list(plt.cm.viridis(np.linspace(0,1,len(self.graphs))))          # Many sheets: spread over a colormap
+
+    def Loops(self,grid=False):
+        return self.Plot(1,2,grid,'_Loops')                                     # Small sweep(xaxis) & Ids(y-axis)
+
+    def Transconductance(self,grid=False):
+        return self.Plot(1,3,grid,'_Transconductance')                          # Small sweep(xaxis) & gm(y-axis)
+
+    def Plot(self,x,y,grid=False,suffix=''):
+        suffix += '_Grid' if grid else ''                                       # Grid and overlay of the same data saved side by side
+        columns = self.graphs[0].columns                                        # Sheets are expected to share columns
+        if grid:
+            #### Small multiples, one sheet per subplot #####
+            ncols = math.ceil(math.sqrt(len(self.graphs)))
+            nrows = math.ceil(len(self.graphs)/ncols)
+            fig, axes = plt.subplots(nrows,ncols,sharex=True,sharey=True,squeeze=False,figsize=(3*ncols+2,2.5*nrows+1))
+            for ax,graph in zip(axes.flat,self.graphs):
+                graph.Draw(ax,x,y)                                              # Every splice of the sheet
+                ax.set_title(graph.name,fontsize='10')
+            for ax in axes.flat[len(self.graphs):]:
+                ax.set_visible(False)                                           # Hide unused grid cells
+            fig.supxlabel(columns[x])                                           # Label x axis
+            fig.supylabel(columns[y])                                           # Label y axis
+        else:
+            #### One plot, one color per sheet #####
+            fig, ax = plt.subplots()
+            handles = []
+            for graph,color in zip(self.graphs,self.Colors()):
+                handles += graph.Draw(ax,x,y,graph.name,color)                  # Every splice of the sheet in its color
+            ax.legend(handles=handles,fontsize='small',ncol=math.ceil(len(handles)/20)) # Legend is the sheet names
+            Labeloffset(ax, label=columns[x], axis="x")                         # Label x axis
+            Labeloffset(ax, label=columns[y], axis="y")                         # Label y axis
+
+        ##### Labeling Plot #####
+        fig.suptitle(f"{self.title}: {columns[y]} vs. {columns[x]}",fontsize='16') # Title is the sheets and what is graphed
+        fig.tight_layout()                                                      # Make plot fit inside window
+        fig.savefig(f"{savefile+self.title}{suffix}.png")                       # Saving plot to png file
+        return fig
+
+class Graphs_Overlay(Overlay):
     def __init__(self,name0,name1): 
+        super().__init__(name0,name1)
         self.name0 = name0                                                      # Input first sheet to graph
         self.name1 = name1                                                      # Input second sheet to graph
-        self.save0 = savefile+self.name0+'.csv'                                 # Path and name1 of csv file to call in one: self.save
-        self.save1 = savefile+self.name1+'.csv'                                 # Path and name2 of csv file to call in one: self.save
-        self.df0 = pd.read_csv(self.save0,index_col=0)                          # Read first csv file, removes index column
-        self.df1 = pd.read_csv(self.save1,index_col=0)                          # Read second csv file, removes index column
-        self.columns0 = list(self.df0)                                          # Lists inputs then outputs
-        self.columns1 = list(self.df1)                                          # Lists inputs then outputs
-
-        ##### Splicing First Dataframe #####    
-        df01 = self.df0.copy(deep=True)                                         # Copy dataframe, leaving first one untouched
-        df01['step'] = df01[self.columns0[0]].diff()                            # Create new column to see when big sweep steps up
-        df01.query('`step` != 0', inplace=True)                                 # Find first rows of each big sweep values
-        orows = self.df0.shape[0]                                               # Find how many rows there are in orignial data frame
-        if df01.shape[0] == 1:                                                  # If only sweeping one value
-            self.rows0 = [0, orows]                                             # Get row value from original data frame and create splice
-        else:   
-            rows = df01.index.array                                             # Create array to represent index values where big sweep chagnes
-            self.rows0 = np.append(rows,orows)                                  # Add final upper limit of splice
-
-        ##### Splicing Second Dataframe #####   
-        df11 = self.df1.copy(deep=True)                                         # Copy dataframe, leaving first one untouched
-        df11['step'] = df11[self.columns1[0]].diff()                            # Create new column to see when big sweep steps up
-        df11.query('`step` != 0', inplace=True)                                 # Find first rows of each big sweep values
-        orows = self.df1.shape[0]                                               # Find how many rows there are in orignial data frame
-        if df11.shape[0] == 1:                                                  # If only sweeping one value
-            self.rows1 = [0, orows]                                             # Get row value from original data frame and create splice
-        else:   
-            rows = df11.index.array                                             # Create array to represent index values where big sweep chagnes
-            self.rows1 = np.append(rows,orows)                                  # Add final upper limit of splice    
-
-       ##### Setup for Plot #####   
-        plt.clf()                                                               # Clear active plots
-        self.upper0 = 0                                                         # Variable for determining the upper limit of the splice
-        self.lower0 = 0                                                         # Variable for determining the lower limit of the splice
-        self.upper1 = 0                                                         # Variable for determining the upper limit of the splice
-        self.lower1 = 0                                                         # Variable for determining the lower limit of the splice
         return  
 
     def Loops_Overlay(self):    
         fig, ax0 = plt.subplots()                                               # Setup for Plot
         ax1 = ax0.twiny()                                                       # Overlay Plots, 2 different y-axis
+        graph0, graph1 = self.graphs
 
-        #### Plotting first csv #####   
-        for y in self.rows0:                                                    # Loop for amount of big sweep vaules
-            self.upper0 += 1                                                    # Increase upper limit for next splice
-            if len(self.rows0)-1 < self.upper0:                                 # Have we reached the final splice?
-                break                                                           # Stop splicing
-            y = self.df0.iloc[self.rows0[self.lower0]:self.rows0[self.upper0]]  # Splice df into each value of big sweep
-            self.lower0 += 1                                                    # Increase upper limit for next splice
-            legend = y.iloc[0,0]                                                # Find what big sweep equals to every splice
-            ax0.plot(y[self.columns0[1]],y[self.columns0[2]], '-', label=f"{self.columns0[0]}: {legend}") # Plot small sweep(xaxis) & Ids(y-axis)
-
-        #### Plotting second #####  
-        for y in self.rows1:                                                    # Loop for amount of big sweep vaules
-            self.upper1 += 1                                                    # Increase upper limit for next splice
-            if len(self.rows1)-1 < self.upper1:                                 # Have we reached the final splice?
-                break                                                           # Stop splicing
-            y = self.df1.iloc[self.rows1[self.lower1]:self.rows1[self.upper1]]  # Splice df into each value of big sweep
-            self.lower1 += 1                                                    # Increase upper limit for next splice
-            legend = y.iloc[0,0]                                                # Find what big sweep equals to every splice
-            ax1.plot(y[self.columns1[1]],y[self.columns1[2]], '-', label=f"{self.columns1[0]}: {legend}") # Plot small sweep(xaxis) & Ids(y-axis)
+        #### Plotting #####   
+        handles0 = graph0.Draw(ax0,1,2,graph0.Legend)                           # Plot first csv small sweep(xaxis) & Ids(y-axis)
+        handles1 = graph1.Draw(ax1,1,2,graph1.Legend)                           # Plot second csv small sweep(xaxis) & Ids(y-axis)
 
         ##### Labeling Plot #####   
-        plt.title(f"{self.name0} & {self.name1}",fontsize='20')                 # Title is name of part and test performed
-        Labeloffset(ax0, label=self.columns0[1], axis="x")                      # Label first x axis
-        Labeloffset(ax1, label=self.columns1[1], axis="x")                      # Label second x axis
-        Labeloffset(ax0, label=self.columns0[2], axis="y")                      # Label y axis
+        ax0.set_title(f"{self.name0} & {self.name1}",fontsize='20')             # Title is name of part and test performed
+        Labeloffset(ax0, label=graph0.columns[1], axis="x")                     # Label first x axis
+        Labeloffset(ax1, label=graph1.columns[1], axis="x")                     # Label second x axis
+        Labeloffset(ax0, label=graph0.columns[2], axis="y")                     # Label y axis
         ax1.yaxis.set(label_position='right',offset_position='right')   
-        ax0.legend()                                                            # Legend of first plot
-        ax1.legend()                                                            # Legend of second plot
-        plt.tight_layout()                                                      # Make plot fit inside window
-        plt.savefig(f"{savefile+self.name0} & {self.name1}.png")                # Saving plot to png file
-        return  
+        ax0.legend(handles=handles0)                                            # Legend of first plot
+        ax1.legend(handles=handles1)                                            # Legend of second plot
+        fig.tight_layout()                                                      # Make plot fit inside window
+        fig.savefig(f"{savefile+self.name0} & {self.name1}.png")                # Saving plot to png file
+        return fig
 
 class Labeloffset():    
     def __init__(self,  ax, label="", axis="y"):    